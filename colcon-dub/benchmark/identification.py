@@ -0,0 +1,77 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+"""
+Compare the identification cost of `dub.json` and `dub.sdl` packages.
+
+Usage: python benchmark/identification.py [--packages N] [--repeat N]
+"""
+
+import argparse
+import json
+from pathlib import Path
+import sys
+import tempfile
+import time
+
+from colcon_core.package_descriptor import PackageDescriptor
+from colcon_dub import dub
+from colcon_dub.dub import identification_cache
+from colcon_dub.package_identification.dub import DubPackageIdentification
+
+sys.path.insert(0, str(Path(__file__).absolute().parents[1] / 'test'))
+from test_dub_sdl import DUB_TEST_PACKAGE_SDL  # noqa: E402 I100
+
+PATH_TO_JSON = Path(__file__).absolute().parents[1] / 'test' / \
+    'dub_test_package' / 'dub.json'
+
+
+def _create_packages(root: Path, filename: str, content: str, count: int):
+    paths = []
+    for i in range(count):
+        path = root / filename / str(i)
+        path.mkdir(parents=True)
+        (path / filename).write_text(content)
+        paths.append(path)
+    return paths
+
+
+def _identify(paths, repeat: int) -> float:
+    extension = DubPackageIdentification()
+    # Measure parsing, not the persistent identification cache
+    identification_cache._cache = False
+    best = None
+    for _ in range(repeat):
+        # Measure parsing, not the per process package cache
+        dub._package_cache.clear()
+        start = time.perf_counter()
+        for path in paths:
+            extension.identify(PackageDescriptor(path))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best / len(paths)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--packages', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        json_paths = _create_packages(
+            Path(tmp), 'dub.json', PATH_TO_JSON.read_text(), args.packages)
+        sdl_paths = _create_packages(
+            Path(tmp), 'dub.sdl', DUB_TEST_PACKAGE_SDL, args.packages)
+        assert json.loads(PATH_TO_JSON.read_text())['name'] == \
+            dub.DubPackage.load(sdl_paths[0]).name
+
+        json_time = _identify(json_paths, args.repeat)
+        sdl_time = _identify(sdl_paths, args.repeat)
+
+    print('dub.json: {t:8.1f} us / package'.format(t=json_time * 1e6))
+    print('dub.sdl:  {t:8.1f} us / package'.format(t=sdl_time * 1e6))
+    print('ratio:    {r:8.2f}'.format(r=sdl_time / json_time))
+
+
+if __name__ == '__main__':
+    main()
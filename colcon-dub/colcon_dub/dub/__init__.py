@@ -3,15 +3,19 @@
 """Represent DUB package and handle dub executable."""
 
 import os
+import re
 import shutil
 import json
 
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, Optional, List
+from typing import Dict, Iterable, List, Optional
 
 from colcon_core.environment_variable import EnvironmentVariable
 from colcon_core.logging import colcon_logger
 
+from colcon_dub.dub.sdl import load_sdl
+
 DUB_COMMAND_ENVIRONMENT_VARIABLE = EnvironmentVariable(
     'DUB_COMMAND', 'The full path to the DUB executable')
 
@@ -21,6 +25,15 @@ IS_WINDOWS = os.name == 'nt'
 
 logger = colcon_logger.getChild(__name__)
 
+# The maximum number of parsed DUB packages kept by `DubPackage.load`
+PACKAGE_CACHE_SIZE = 4096
+
+_package_cache = OrderedDict()
+
+_package_path_indexes = {}
+
+_VARIABLE = re.compile(r'\$(?:(\w+)|\{([^}]*)\})')
+
 
 class DubConfiguration:
     """This class represents DUB build configuration."""
@@ -62,15 +75,23 @@ class DubConfiguration:
 
 
 class DubPackage:
-    """This class represents DUB package."""
+    """
+    This class represents DUB package.
+
+    Only the name and version are read when the package is constructed.
+    Configurations, dependencies and the file directives are built on first
+    access, so identifying packages stays cheap.
+    """
 
     __slots__ = (
         'name',
         'version',
         'path',
-        'configurations',
-        'install_files',
-        'create_files'
+        '_recipe',
+        '_configurations',
+        '_dependencies',
+        '_install_files',
+        '_create_files'
     )
 
     def __init__(self, path: Path):
@@ -79,7 +100,7 @@ class DubPackage:
         if (path / 'dub.json').exists():
             dub_cache = _load_json(path / 'dub.json')
         elif (path / 'dub.sdl').exists():
-            raise RuntimeError('Not implemented : dub.sdl')
+            dub_cache = load_sdl(path / 'dub.sdl')
         else:
             return
 
@@ -92,50 +113,273 @@ class DubPackage:
         else:
             self.version = '~master'
         self.path = path.absolute()
-        self.configurations = []
-
-        if 'configurations' in dub_cache:
-            for c in dub_cache['configurations']:
-                dc = DubConfiguration(c)
-                if dc.valid():
-                    self.configurations.append(dc)
-        else:
-            self.configurations.append(
-                DubConfiguration({'name': None, 'targetName': self.name}))
-
-        os.environ['DUB_PACKAGE'] = self.name
-
-        if 'installFiles' in dub_cache:
-            self.install_files = _replace(dub_cache['installFiles'])
-        else:
-            self.install_files = {}
-        if 'createFiles' in dub_cache:
-            self.create_files = _replace(dub_cache['createFiles'])
-        else:
-            self.create_files = {}
-
-    async def create_local_packages(self, depends: List['DubPackage']):
+        self._recipe = dub_cache
+        self._configurations = None
+        self._dependencies = None
+        self._install_files = None
+        self._create_files = None
+
+    @property
+    def configurations(self) -> List[DubConfiguration]:
+        """Get the valid build configurations."""
+        if self._configurations is None:
+            configurations = []
+            if 'configurations' in self._recipe:
+                for c in self._recipe['configurations']:
+                    dc = DubConfiguration(c)
+                    if dc.valid():
+                        configurations.append(dc)
+            else:
+                configurations.append(
+                    DubConfiguration({'name': None, 'targetName': self.name}))
+            self._configurations = configurations
+        return self._configurations
+
+    @property
+    def dependencies(self) -> Dict:
+        """Get the dependencies of all configurations by package name."""
+        if self._dependencies is None:
+            # Any of the configurations is built
+            dependencies = {}
+            for c in self._recipe.get('configurations', []):
+                dependencies.update(_dependencies(c))
+            dependencies.update(_dependencies(self._recipe))
+            self._dependencies = dependencies
+        return self._dependencies
+
+    @property
+    def install_files(self) -> Dict[str, List[str]]:
+        """Get the `installFiles` directive with expanded variables."""
+        if self._install_files is None:
+            self._install_files = _replace(
+                self._recipe.get('installFiles', {}),
+                {'DUB_PACKAGE': self.name})
+        return self._install_files
+
+    @property
+    def create_files(self) -> Dict[str, List[str]]:
+        """Get the `createFiles` directive with expanded variables."""
+        if self._create_files is None:
+            self._create_files = _replace(
+                self._recipe.get('createFiles', {}),
+                {'DUB_PACKAGE': self.name})
+        return self._create_files
+
+    @property
+    def source_paths(self) -> List[str]:
+        """Get the `sourcePaths` of the package or the existing defaults."""
+        if 'sourcePaths' in self._recipe:
+            return self._recipe['sourcePaths']
+        return [p for p in ('source', 'src') if (self.path / p).is_dir()]
+
+    @property
+    def install_excludes(self) -> List[str]:
+        """Get the `installExclude` patterns of the package directory."""
+        return self._recipe.get('installExclude', [])
+
+    @property
+    def install_includes(self) -> List[str]:
+        """Get the `installInclude` patterns overriding the excludes."""
+        return self._recipe.get('installInclude', [])
+
+    def test_object_path(self, config: DubConfiguration) -> Path:
+        """Get the path of the executable `dub test` builds."""
+        name = '{name}-test-{config.name}'.format(
+            name=self.name.replace('.', '_').replace(':', '_'),
+            config=config)
+        if IS_WINDOWS:
+            name += '.exe'
+        return config.target_path / name
+
+    async def create_local_packages(
+        self, depends: List['DubPackage'], path: Optional[Path] = None
+    ) -> bool:
+        """
+        Write `.dub/packages/local-packages.json` for the dependencies.
+
+        The file is only replaced if its content changes, so DUB doesn't
+        consider the dependencies of the package changed by a rebuild.
+
+        :param depends: The DUB packages provided by colcon
+        :param path: The directory DUB is invoked in, the package directory
+          by default
+        :returns: True if the file was written
+        """
         packages = [
             {
                 'name': dep.name,
                 'path': str(dep.path),
                 'version': dep.version
-            } for dep in depends
+            } for dep in sorted(depends, key=lambda dep: dep.name)
         ]
-        local_path = self.path / '.dub' / 'packages' / 'local-packages.json'
+        content = json.dumps(packages, indent=4)
+        local_path = (path or self.path) / '.dub' / 'packages' / \
+            'local-packages.json'
+        try:
+            if local_path.read_text() == content:
+                return False
+        except OSError:
+            pass
+
+        # Replace the file at once, DUB may read it concurrently
         local_path.parent.mkdir(parents=True, exist_ok=True)
-
-        with open(local_path, 'w') as f:
-            json.dump(packages, f, indent=4)
+        tmp_path = local_path.with_name(local_path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            f.write(content)
+        os.replace(tmp_path, local_path)
+        return True
 
     @classmethod
     def load(cls, path: Path) -> Optional['DubPackage']:
-        """Read DUB package file and construct instance."""
+        """
+        Read DUB package file and construct instance.
+
+        Parsed packages are cached per process. A cached package is reused as
+        long as the mtime and size of its package file are unchanged.
+        """
+        for filename in ('dub.json', 'dub.sdl'):
+            manifest = path / filename
+            try:
+                st = manifest.stat()
+            except OSError:
+                continue
+            break
+        else:
+            return None
+
+        key = str(manifest.resolve())
+        stamp = (st.st_mtime_ns, st.st_size)
+        cached = _package_cache.get(key)
+        if cached is not None and cached[0] == stamp and \
+                cached[1].path == path.absolute():
+            _package_cache.move_to_end(key)
+            return cached[1]
+
         dub_package = DubPackage(path)
         if dub_package.name is None:
             return None
-        else:
-            return dub_package
+
+        _package_cache[key] = (stamp, dub_package)
+        _package_cache.move_to_end(key)
+        while len(_package_cache) > PACKAGE_CACHE_SIZE:
+            _package_cache.popitem(last=False)
+        return dub_package
+
+
+def find_packages(
+    dub_package_path: str, names: Iterable[str],
+    prefixes: Optional[Dict[str, str]] = None
+) -> List[DubPackage]:
+    """
+    Find DUB packages by name in their install prefixes or `DUB_PACKAGE_PATH`.
+
+    A package installed by colcon is found in `<prefix>/lib/dub/<name>` of
+    its prefix. Otherwise the entry of `DUB_PACKAGE_PATH` named after the
+    package is used, before the other entries are searched. Every entry is
+    loaded at most once per value of `DUB_PACKAGE_PATH` and names which
+    aren't found, like CMake packages, aren't searched again.
+
+    :param dub_package_path: The value of `DUB_PACKAGE_PATH`
+    :param names: The names of the packages to find
+    :param prefixes: The install prefixes of the packages by name, like the
+      dependencies of a task context
+    :returns: The found packages in the order of names
+    """
+    index = _package_path_indexes.get(dub_package_path)
+    if index is None:
+        index = PackagePathIndex(dub_package_path)
+        _package_path_indexes[dub_package_path] = index
+
+    packages = []
+    for name in names:
+        dub_package = None
+        if prefixes and prefixes.get(name):
+            path = Path(prefixes[name]) / 'lib' / 'dub' / name
+            dub_package = DubPackage.load(path)
+            if dub_package is not None:
+                # The same directory is usually an entry of the variable
+                index.loaded.add(path)
+                index.names.setdefault(dub_package.name, path)
+        if dub_package is None or dub_package.name != name:
+            dub_package = index.find(name)
+        if dub_package is not None:
+            packages.append(dub_package)
+    return packages
+
+
+class PackagePathIndex:
+    """This class represents the DUB packages of a `DUB_PACKAGE_PATH`."""
+
+    __slots__ = (
+        'entries',
+        'basenames',
+        'names',
+        'loaded',
+        'position',
+        'missing'
+    )
+
+    def __init__(self, dub_package_path: str):
+        self.entries = [
+            Path(path) for path in dub_package_path.split(os.pathsep)
+            if path]
+        self.basenames = {}
+        for path in self.entries:
+            # The first entry takes precedence like in `PATH`
+            self.basenames.setdefault(path.name, path)
+        self.names = {}
+        self.loaded = set()
+        self.position = 0
+        self.missing = set()
+
+    def find(self, name: str) -> Optional[DubPackage]:
+        """
+        Find a DUB package by name.
+
+        Installed directories are named after their package, but the
+        variable can also be extended manually with any directory. These
+        entries are only loaded once a name isn't found otherwise.
+
+        :param name: The name of the package
+        :returns: The package, or None if no entry contains it
+        """
+        if name in self.names:
+            return DubPackage.load(self.names[name])
+        if name in self.missing:
+            return None
+
+        path = self.basenames.get(name)
+        if path is not None and path not in self.loaded:
+            self.loaded.add(path)
+            dub_package = DubPackage.load(path)
+            if dub_package is not None:
+                self.names.setdefault(dub_package.name, path)
+                if dub_package.name == name:
+                    return dub_package
+
+        while self.position < len(self.entries):
+            path = self.entries[self.position]
+            self.position += 1
+            if path in self.loaded:
+                continue
+            self.loaded.add(path)
+            dub_package = DubPackage.load(path)
+            if dub_package is None:
+                continue
+            self.names.setdefault(dub_package.name, path)
+            if dub_package.name == name:
+                return dub_package
+
+        self.missing.add(name)
+        return None
+
+
+def _dependencies(recipe: Dict) -> Dict:
+    dependencies = {}
+    for name, spec in recipe.get('dependencies', {}).items():
+        # A sub package depends on its parent package
+        dependencies[name.split(':')[0]] = spec
+    return dependencies
 
 
 def _load_json(path: Path) -> Dict:
@@ -143,22 +387,40 @@ def _load_json(path: Path) -> Dict:
         return json.load(f)
 
 
-def _replace(src):
+def _replace(src, variables: Dict[str, str]):
     if isinstance(src, str):
-        return os.path.expandvars(src)
+        return _expandvars(src, variables)
     elif isinstance(src, list):
-        return [_replace(s) for s in src]
+        return [_replace(s, variables) for s in src]
     elif isinstance(src, dict):
         dst = {}
         for key, value in src.items():
-            dst_key = os.path.expandvars(key)
-            dst_value = _replace(value)
+            dst_key = _expandvars(key, variables)
+            dst_value = _replace(value, variables)
             dst[dst_key] = dst_value
         return dst
     else:
         assert False
 
 
+def _expandvars(src: str, variables: Dict[str, str]) -> str:
+    """
+    Expand shell variables like `os.path.expandvars`.
+
+    The given variables take precedence over the environment, which is not
+    modified. Unknown variables are left unchanged.
+    """
+    if '$' not in src:
+        return src
+
+    def replace(m):
+        name = m.group(1) or m.group(2)
+        if name in variables:
+            return variables[name]
+        return os.environ.get(name, m.group(0))
+    return _VARIABLE.sub(replace, src)
+
+
 def _which_executable(environment_variable: str, executable: str) -> str:
     """
     Determin the path of an executable.
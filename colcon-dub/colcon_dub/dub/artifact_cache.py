@@ -0,0 +1,204 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+"""
+Share the build outputs of DUB configurations between workspaces.
+
+Outputs are stored in a local directory by the fingerprint of the
+configuration, which covers the compiler, the flags, the configuration, the
+sources and the fingerprints of the dependencies without any absolute path.
+A clean workspace restores the outputs instead of compiling them again.
+
+The size of the directory is bounded. The total size of the entries is
+kept in an index file updated by every store, so the entries are only
+scanned when the index is missing or exceeds the limit. Concurrent stores
+can lose an update of the index, the scan then counts the exact size again
+and removes the least recently used entries beyond the limit.
+"""
+
+import json
+import os
+import re
+import shutil
+import tempfile
+
+from pathlib import Path
+from typing import List, Optional
+
+from colcon_core.environment_variable import EnvironmentVariable
+from colcon_core.logging import colcon_logger
+
+from colcon_dub.dub import DubConfiguration
+from colcon_dub.dub.fingerprint import OUTPUT_SUFFIXES
+
+ARTIFACT_CACHE_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_DUB_ARTIFACT_CACHE',
+    'The directory of the DUB artifact cache shared between workspaces')
+
+logger = colcon_logger.getChild(__name__)
+
+# The default maximum size of the cache directory
+DEFAULT_CACHE_SIZE = 5 << 30
+
+# The file of each entry listing its outputs
+ENTRY_MANIFEST = 'manifest.json'
+
+# The file of the cache directory containing the total size of the entries
+SIZE_INDEX = 'size.json'
+
+_SIZE = re.compile(r'(\d+(?:\.\d+)?)\s*([KMGT]?)(?:i?B)?', re.IGNORECASE)
+
+
+class ArtifactCache:
+    """This class represents a content-addressed cache of build outputs."""
+
+    __slots__ = (
+        'path',
+        'max_size'
+    )
+
+    def __init__(self, path: Path, max_size: int = DEFAULT_CACHE_SIZE):
+        self.path = path
+        self.max_size = max_size
+
+    def restore(self, key: str, root: Path) -> Optional[List[str]]:
+        """
+        Copy the outputs stored for a key into a directory.
+
+        :param key: The fingerprint of the configuration
+        :param root: The directory DUB is invoked in
+        :returns: The restored paths relative to the root, or None if the
+          key isn't cached
+        """
+        entry = self._entry_path(key)
+        try:
+            with open(entry / ENTRY_MANIFEST, 'r') as f:
+                files = json.load(f)['files']
+        except (OSError, ValueError, KeyError):
+            return None
+        for rel in files:
+            dst = root / rel
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            if dst.is_symlink() or dst.exists():
+                dst.unlink()
+            try:
+                shutil.copy2(entry / 'files' / rel, dst)
+            except OSError:
+                # Evicted concurrently
+                return None
+        # Mark the entry as recently used
+        os.utime(entry / ENTRY_MANIFEST)
+        return files
+
+    def store(self, key: str, root: Path, files: List[str]):
+        """
+        Store outputs for a key and evict entries beyond the size limit.
+
+        :param key: The fingerprint of the configuration
+        :param root: The directory DUB is invoked in
+        :param files: The outputs relative to the root
+        """
+        entry = self._entry_path(key)
+        if (entry / ENTRY_MANIFEST).exists():
+            os.utime(entry / ENTRY_MANIFEST)
+            return
+        entry.parent.mkdir(parents=True, exist_ok=True)
+        # Populate the entry next to its final location and rename it, so
+        # concurrent builds never see a partial entry
+        tmp = Path(tempfile.mkdtemp(prefix='.tmp-', dir=str(entry.parent)))
+        try:
+            size = 0
+            for rel in files:
+                dst = tmp / 'files' / rel
+                dst.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(root / rel, dst)
+                size += dst.stat().st_size
+            with open(tmp / ENTRY_MANIFEST, 'w') as f:
+                json.dump({'files': files, 'size': size}, f)
+            os.replace(tmp, entry)
+        except OSError:
+            # Stored by a concurrent build
+            shutil.rmtree(tmp, ignore_errors=True)
+            return
+
+        total = self._read_size()
+        if total is None or total + size > self.max_size:
+            self.evict()
+        else:
+            self._write_size(total + size)
+
+    def evict(self):
+        """Remove the least recently used entries beyond the size limit."""
+        entries = []
+        total = 0
+        for manifest in self.path.glob('*/*/' + ENTRY_MANIFEST):
+            entry = manifest.parent
+            try:
+                with open(manifest, 'r') as f:
+                    size = json.load(f)['size']
+            except (OSError, ValueError, KeyError):
+                size = sum(
+                    p.stat().st_size for p in entry.rglob('*')
+                    if p.is_file())
+            entries.append((manifest.stat().st_mtime, size, entry))
+            total += size
+        for _, size, entry in sorted(entries, key=lambda e: e[0]):
+            if total <= self.max_size:
+                break
+            logger.info(
+                "Evicting '{entry}' from the artifact cache".format_map(
+                    locals()))
+            shutil.rmtree(entry, ignore_errors=True)
+            total -= size
+        self._write_size(total)
+
+    def _read_size(self) -> Optional[int]:
+        try:
+            with open(self.path / SIZE_INDEX, 'r') as f:
+                return int(json.load(f)['size'])
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+
+    def _write_size(self, size: int):
+        try:
+            fd, tmp_path = tempfile.mkstemp(
+                prefix='.tmp-', dir=str(self.path))
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'size': size}, f)
+            os.replace(tmp_path, self.path / SIZE_INDEX)
+        except OSError as e:  # noqa: F841
+            logger.warning(
+                "Failed to write the size of the artifact cache "
+                "'{self.path}': {e}".format_map(locals()))
+
+    def _entry_path(self, key: str) -> Path:
+        return self.path / key[:2] / key
+
+
+def get_output_files(root: Path, config: DubConfiguration) -> List[str]:
+    """
+    Get the existing outputs of a configuration.
+
+    :param root: The directory DUB is invoked in
+    :param config: The configuration
+    :returns: The paths relative to the root, empty if the outputs are
+      outside of the root
+    """
+    target_path = config.target_path
+    if target_path.is_absolute() or '..' in target_path.parts:
+        return []
+    names = [config.target_name]
+    for suffix in sorted(OUTPUT_SUFFIXES):
+        names.append(config.target_name + suffix)
+        names.append('lib' + config.target_name + suffix)
+    return [
+        (target_path / name).as_posix() for name in names
+        if (root / target_path / name).is_file()]
+
+
+def parse_size(value: str) -> int:
+    """Parse a size like `512M` or `5G` to bytes."""
+    m = _SIZE.fullmatch(value.strip())
+    if m is None:
+        raise ValueError("Invalid size '{value}'".format_map(locals()))
+    exponent = ' KMGT'.index(m.group(2).upper() or ' ')
+    return int(float(m.group(1)) * (1 << (10 * exponent)))
@@ -0,0 +1,239 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+"""
+Build many small DUB packages with a single invocation of DUB.
+
+Packages which become ready to build at about the same time are collected
+into a batch. The batch is built through a generated package in the build
+directory, which depends on the members by path and selects the
+configurations to build with `subConfigurations`. DUB starts, resolves the
+dependencies and reads `local-packages.json` once for the whole batch.
+
+A dependency is built in one configuration only, so the generated package
+has a configuration per round: round N builds the N-th configuration of
+every member. Executables can't be dependencies and are built by their
+package alone, as are the configurations of a batch which failed, so errors
+are reported for the package which caused them.
+
+The output of DUB is split by the lines announcing the package being built
+and posted to the task of that member. The output of the dependency
+resolution and of packages outside of the batch goes to the first member.
+"""
+
+import asyncio
+import hashlib
+import json
+import re
+
+from pathlib import Path
+from typing import Dict, Hashable, List, Optional
+
+from colcon_core.event.command import Command
+from colcon_core.event.command import CommandEnded
+from colcon_core.event.output import StderrLine
+from colcon_core.event.output import StdoutLine
+from colcon_core.logging import colcon_logger
+from colcon_core.subprocess import run as subprocess_run
+
+from colcon_dub.dub import DUB_EXECUTABLE
+from colcon_dub.dub import DubPackage
+
+logger = colcon_logger.getChild(__name__)
+
+# The name of the generated package
+BATCH_PACKAGE_NAME = 'colcon_dub_batch'
+
+# The line of DUB starting the build of a package, e.g.
+# `pkg ~master: building configuration "library"...` or
+# `Building pkg ~master: building configuration [library]`
+_PACKAGE_LINE = re.compile(
+    r'^\s*(?:\w+\s+)?([^\s:]+)\s+[^\s:]+:\s+'
+    r'(?:building configuration|target for configuration)')
+
+_open_batches = {}
+_locks = {}
+
+
+class BatchMember:
+    """This class represents a DUB package built as part of a batch."""
+
+    __slots__ = (
+        'dub',
+        'path',
+        'configurations',
+        'depends',
+        'built',
+        'context'
+    )
+
+    def __init__(
+        self, dub: DubPackage, path: Path, configurations: List[str],
+        depends: List[DubPackage]
+    ):
+        """
+        Construct a BatchMember.
+
+        :param dub: The DUB package
+        :param path: The directory DUB builds the package in
+        :param configurations: The library configurations to build
+        :param depends: The DUB packages provided by colcon
+        """
+        self.dub = dub
+        self.path = path
+        self.configurations = configurations
+        self.depends = depends
+        self.built = False
+        # The task context the output of the package is posted to
+        self.context = None
+
+
+async def build_in_batch(
+    context, key: Hashable, member: BatchMember, env: Dict, *,
+    path: Path, dub_args: List[str], window: float
+):
+    """
+    Build a package together with the packages joining within a time window.
+
+    The first package of a batch waits `window` seconds for others to join
+    and builds the batch. A batch of one package isn't built. Afterwards
+    `member.built` tells whether the configurations of the member were
+    built, otherwise the package has to build them alone.
+
+    :param context: The task context of the package, which gets the output
+      of building it
+    :param key: Packages are only built together if their keys are equal,
+      e.g. the DUB arguments and the compiler environment
+    :param member: The package to build
+    :param env: The environment to invoke DUB with
+    :param path: The directory to generate the batch packages in
+    :param dub_args: The arguments passed to `dub build`
+    :param window: The time to wait for other packages in seconds
+    """
+    member.context = context
+    batch = _open_batches.get(key)
+    if batch is not None:
+        batch[0].append(member)
+        await asyncio.shield(batch[1])
+        return
+
+    members = [member]
+    done = asyncio.get_event_loop().create_future()
+    _open_batches[key] = (members, done)
+    try:
+        try:
+            await asyncio.sleep(window)
+        finally:
+            del _open_batches[key]
+        if len(members) < 2:
+            return
+
+        # A batch of the same key may still be building in the directory
+        lock = _locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            rc = await _build_batch(
+                members, path / _key_hash(key), env, dub_args)
+        if not rc:
+            for m in members:
+                m.built = True
+    finally:
+        # Let the other members build alone if the batch failed
+        if not done.done():
+            done.set_result(None)
+
+
+def create_batch_package(path: Path, members: List[BatchMember]) -> int:
+    """
+    Write the recipe of the package building a batch.
+
+    The recipe is only written if it changed.
+
+    :param path: The directory of the generated package
+    :param members: The packages of the batch
+    :returns: The number of rounds, i.e. configurations of the package
+    """
+    rounds = max(len(m.configurations) for m in members)
+    configurations = []
+    for i in range(rounds):
+        dependencies = {}
+        sub_configurations = {}
+        for m in members:
+            if i >= len(m.configurations):
+                continue
+            dependencies[m.dub.name] = {'path': str(m.path)}
+            if m.configurations[i] is not None:
+                sub_configurations[m.dub.name] = m.configurations[i]
+        configurations.append({
+            'name': 'round{i}'.format_map(locals()),
+            'dependencies': dependencies,
+            'subConfigurations': sub_configurations,
+        })
+    recipe = json.dumps({
+        'name': BATCH_PACKAGE_NAME,
+        'targetType': 'none',
+        'configurations': configurations,
+    }, indent=4)
+
+    recipe_path = path / 'dub.json'
+    try:
+        if recipe_path.read_text() == recipe:
+            return rounds
+    except OSError:
+        pass
+    path.mkdir(parents=True, exist_ok=True)
+    recipe_path.write_text(recipe)
+    return rounds
+
+
+async def _build_batch(
+    members: List[BatchMember], path: Path, env: Dict, dub_args: List[str]
+) -> Optional[int]:
+    names = ', '.join(m.dub.name for m in members)
+    logger.info(
+        'Building {n} DUB packages in one batch: {names}'.format(
+            n=len(members), names=names))
+
+    rounds = create_batch_package(path, members)
+    depends = {}
+    for m in members:
+        for dep in m.depends:
+            depends.setdefault(dep.name, dep)
+    await DubPackage(path).create_local_packages(list(depends.values()))
+
+    for i in range(rounds):
+        cmd = [DUB_EXECUTABLE, 'build', '-c', 'round{i}'.format_map(locals())]
+        cmd += dub_args
+        completed = await _run(members, cmd, cwd=str(path), env=env)
+        if completed.returncode:
+            logger.warning(
+                'The batch of {names} failed, building the packages '
+                'alone'.format_map(locals()))
+            return completed.returncode
+
+
+async def _run(members: List[BatchMember], cmd, *, cwd: str, env: Dict):
+    """Run DUB and post each line to the member it belongs to."""
+    contexts = {m.dub.name: m.context for m in members}
+    current = [members[0].context]
+
+    def post(event_type, line):
+        text = line.decode(errors='replace') \
+            if isinstance(line, bytes) else line
+        m = _PACKAGE_LINE.match(text)
+        if m is not None:
+            current[0] = contexts.get(m.group(1), members[0].context)
+        current[0].put_event_into_queue(event_type(line))
+
+    for m in members:
+        m.context.put_event_into_queue(Command(cmd, cwd=cwd, env=env))
+    completed = await subprocess_run(
+        cmd, lambda line: post(StdoutLine, line),
+        lambda line: post(StderrLine, line), cwd=cwd, env=env,
+        use_pty=False)
+    for m in members:
+        m.context.put_event_into_queue(CommandEnded(
+            cmd, cwd=cwd, env=env, returncode=completed.returncode))
+    return completed
+
+
+def _key_hash(key: Hashable) -> str:
+    return hashlib.sha256(repr(key).encode()).hexdigest()[:16]
@@ -0,0 +1,154 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+"""
+Reuse the command environment of packages with the same dependencies.
+
+`colcon_core.shell.get_command_environment()` sources the hooks of every
+dependency in a subshell, which takes a noticeable part of the time of small
+packages in deep dependency graphs. The environment only depends on the
+environment of colcon, the dependencies and their hooks, so it is cached by
+a key of those. Packages with the same dependencies share the environment
+within an invocation. The build and the test task of a package have
+different keys, since colcon test passes the package itself as a
+dependency, so each package keeps the last few environments in its build
+directory for the next invocation.
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict
+
+from colcon_core.shell import get_command_environment
+
+# The directories of the hooks of a package relative to its share directory
+HOOK_DIRECTORIES = ('', 'hook', 'environment')
+
+# The maximum number of environments kept per package, e.g. for the build
+# and the test task
+COMMAND_ENVIRONMENT_CACHE_SIZE = 4
+
+# Variables describing the working directory of the shell the environment
+# was captured in, which are wrong for any other directory
+IGNORED_VARIABLES = ('PWD', 'OLDPWD')
+
+_environments = {}
+
+
+async def get_cached_command_environment(
+    task_name: str, build_base: str, dependencies: Dict[str, str]
+) -> Dict[str, str]:
+    """
+    Get the environment variables to invoke commands.
+
+    The arguments are the same as of `get_command_environment()`. The
+    environment is also stored in
+    `<build_base>/colcon_dub/command_environment.json`. `PWD` and `OLDPWD`
+    are removed, since commands are invoked in other directories.
+
+    :returns: The environment variables
+    :raises RuntimeError: if the environment can't be determined
+    """
+    key = get_environment_key(dependencies)
+    cache_path = Path(build_base) / 'colcon_dub' / 'command_environment.json'
+
+    saved = False
+    env = _environments.get(key)
+    if env is None:
+        env = _load(cache_path, key)
+        saved = env is not None
+    if env is None:
+        # The shell extension removes the dependencies which are already in
+        # the environment from the dictionary
+        env = asyncio.ensure_future(get_command_environment(
+            task_name, build_base, OrderedDict(dependencies)))
+        _environments[key] = env
+    if isinstance(env, asyncio.Future):
+        # Packages with the same dependencies wait for the same environment
+        future = env
+        try:
+            env = await asyncio.shield(future)
+        except RuntimeError:
+            # Don't cache the failure
+            if _environments.get(key) is future:
+                del _environments[key]
+            raise
+    env = {
+        name: value for name, value in env.items()
+        if name not in IGNORED_VARIABLES}
+    _environments[key] = env
+
+    if not saved and _load(cache_path, key) is None:
+        _save(cache_path, key, env)
+    return dict(env)
+
+
+def get_environment_key(dependencies: Dict[str, str]) -> str:
+    """
+    Get the key of the command environment of a set of dependencies.
+
+    The key covers the environment of the current process except for the
+    working directory, the names and paths of the dependencies in order and
+    the modification time and size of their hook files.
+
+    :param dependencies: The ordered dictionary mapping dependency names to
+      their paths
+    :returns: A hex digest
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps(sorted(
+        item for item in os.environ.items()
+        if item[0] not in IGNORED_VARIABLES)).encode())
+    for name, path in dependencies.items():
+        h.update(json.dumps([name, str(path)]).encode())
+        share = Path(path) / 'share' / name
+        for directory in HOOK_DIRECTORIES:
+            try:
+                entries = sorted(
+                    os.scandir(share / directory), key=lambda e: e.name)
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if not entry.is_file():
+                        continue
+                    st = entry.stat()
+                except OSError:
+                    continue
+                h.update(json.dumps([
+                    directory, entry.name, st.st_mtime_ns, st.st_size,
+                ]).encode())
+    return h.hexdigest()
+
+
+def _load(path: Path, key: str):
+    return _read(path).get(key)
+
+
+def _save(path: Path, key: str, env: Dict[str, str]):
+    environments = _read(path)
+    environments.pop(key, None)
+    environments[key] = env
+    while len(environments) > COMMAND_ENVIRONMENT_CACHE_SIZE:
+        del environments[next(iter(environments))]
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(path.name + '.tmp')
+    with open(tmp_path, 'w') as f:
+        json.dump({'environments': environments}, f)
+    os.replace(tmp_path, path)
+
+
+def _read(path: Path) -> Dict[str, Dict[str, str]]:
+    """Read the environments by key, the oldest first."""
+    try:
+        with open(path, 'r') as f:
+            environments = json.load(f)['environments']
+    except (OSError, ValueError, KeyError, TypeError):
+        return OrderedDict()
+    if not isinstance(environments, dict):
+        return OrderedDict()
+    return OrderedDict(environments)
@@ -0,0 +1,151 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+"""
+Fetch the external dependencies of DUB packages once per invocation.
+
+Packages built in parallel often share registry dependencies. Each distinct
+dependency is fetched by the first package which needs it while the other
+packages wait for the same fetch, so `~/.dub/packages` is written once and
+the builds can skip the registry afterwards.
+
+The versions of the indirect dependencies are only known from
+`dub.selections.json`. A package without it is resolved by
+`dub upgrade --missing-only` first, which writes the file.
+"""
+
+import asyncio
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from colcon_core.logging import colcon_logger
+from colcon_core.task import run
+
+from colcon_dub.dub import DUB_EXECUTABLE
+from colcon_dub.dub import DubPackage
+from colcon_dub.dub.fingerprint import read_selections
+
+logger = colcon_logger.getChild(__name__)
+
+_fetches = {}
+
+
+def get_external_dependencies(
+    dub: DubPackage, local: Iterable[str], path: Optional[Path] = None
+) -> Dict[str, str]:
+    """
+    Get the registry dependencies of a DUB package.
+
+    `dub.selections.json` lists the whole resolved dependency tree, so its
+    versions are fetched including those of indirect dependencies. The
+    direct dependencies of the recipe are only used for packages which
+    aren't selected. Path dependencies, optional dependencies and packages
+    provided by colcon are skipped.
+
+    :param dub: The DUB package
+    :param local: The names of the packages provided by colcon
+    :param path: The directory DUB is invoked in, which contains
+      `dub.selections.json`, the package directory by default
+    :returns: The mapping from package name to version specification
+    """
+    local = set(local)
+    specs = dict(dub.dependencies)
+    specs.update(read_selections(path or dub.path) or {})
+    dependencies = {}
+    for name, spec in specs.items():
+        if name in local:
+            continue
+        version = _get_version(spec)
+        if version is not None:
+            dependencies[name] = version
+    return dependencies
+
+
+async def prefetch_dependencies(
+    context, dub: DubPackage, path: Path, local: Iterable[str], env: Dict,
+    registry: Optional[str] = None
+) -> Optional[int]:
+    """
+    Fetch all registry dependencies of a DUB package before it is built.
+
+    A package without `dub.selections.json` is resolved first, so the
+    indirect dependencies are fetched too.
+
+    :param context: The task context of the package
+    :param dub: The DUB package
+    :param path: The directory DUB is invoked in
+    :param local: The names of the packages provided by colcon
+    :param env: The environment to invoke DUB with
+    :param registry: A local directory used as package registry instead of
+      the default registries
+    :returns: The return code of the first failed command
+    """
+    if read_selections(path) is None:
+        cmd = [DUB_EXECUTABLE, 'upgrade', '--missing-only']
+        cmd += _get_registry_args(registry)
+        completed = await run(context, cmd, cwd=str(path), env=env)
+        if completed.returncode:
+            logger.error(
+                "Failed to resolve the dependencies of '{dub.name}'"
+                .format_map(locals()))
+            return completed.returncode
+    return await fetch_dependencies(
+        context, get_external_dependencies(dub, local, path), env,
+        registry=registry)
+
+
+async def fetch_dependencies(
+    context, dependencies: Dict[str, str], env: Dict,
+    registry: Optional[str] = None
+) -> Optional[int]:
+    """
+    Fetch dependencies, sharing fetches between packages.
+
+    :param context: The task context of the package which needs them
+    :param dependencies: The mapping from package name to version
+      specification
+    :param env: The environment to invoke DUB with
+    :param registry: A local directory used as package registry instead of
+      the default registries
+    :returns: The return code of the first failed fetch
+    """
+    futures = []
+    for name, version in sorted(dependencies.items()):
+        key = (name, version, registry)
+        if key not in _fetches:
+            _fetches[key] = asyncio.ensure_future(
+                _fetch(context, name, version, env, registry))
+        futures.append(_fetches[key])
+
+    for rc in await asyncio.gather(*futures):
+        if rc:
+            return rc
+
+
+async def _fetch(context, name, version, env, registry) -> Optional[int]:
+    cmd = [DUB_EXECUTABLE, 'fetch', '{name}@{version}'.format_map(locals())]
+    cmd += _get_registry_args(registry)
+    completed = await run(context, cmd, env=env)
+    if completed.returncode:
+        logger.error(
+            "Failed to fetch '{name}@{version}'".format_map(locals()))
+        return completed.returncode
+
+
+def _get_registry_args(registry: Optional[str]) -> List[str]:
+    if registry is None:
+        return []
+    registry_url = Path(registry).absolute().as_uri()
+    return [
+        '--registry={registry_url}'.format_map(locals()),
+        '--skip-registry=standard',
+    ]
+
+
+def _get_version(spec) -> Optional[str]:
+    if isinstance(spec, str):
+        return spec
+    if isinstance(spec, dict) and 'path' not in spec and \
+            not spec.get('optional', False):
+        return spec.get('version')
+    return None
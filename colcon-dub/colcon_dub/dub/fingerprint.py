@@ -0,0 +1,260 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+"""
+Compute fingerprints of DUB packages.
+
+A fingerprint is a hash over everything which affects the result of
+`dub build`: the sources and recipe of the package, the arguments passed to
+DUB, the compiler and the fingerprints of the dependencies. It doesn't
+contain any absolute path, so the same sources produce the same fingerprint
+in every workspace.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from colcon_core.logging import colcon_logger
+from colcon_core.subprocess import check_output
+
+from colcon_dub.dub import DubPackage
+
+logger = colcon_logger.getChild(__name__)
+
+# The file in the installed DUB package which holds its fingerprint
+FINGERPRINT_FILE = '.colcon_dub_fingerprint'
+
+# The file extensions of build outputs which are not part of the sources
+OUTPUT_SUFFIXES = {
+    '.o', '.obj', '.a', '.so', '.dylib', '.lib', '.dll', '.exe', '.pdb', '.lst'
+}
+
+# Files written to the package directory by DUB itself. Only the versions
+# selected in `dub.selections.json` are part of the fingerprint, not its
+# content.
+GENERATED_FILES = ('dub.selections.json',)
+
+_compiler_identities = {}
+
+
+class SourceHashes:
+    """
+    This class caches content hashes of source files.
+
+    A hash is reused as long as the size and mtime of the file are unchanged,
+    so unchanged sources are not read again.
+    """
+
+    __slots__ = (
+        'path',
+        'hashes',
+        'modified'
+    )
+
+    def __init__(self, path: Optional[Path] = None):
+        self.path = path
+        self.modified = False
+        self.hashes = {}
+        if path is None:
+            return
+        try:
+            with open(path, 'r') as f:
+                self.hashes = json.load(f)
+        except (OSError, ValueError):
+            pass
+
+    def digest(self, root: Path, excludes: Iterable[str] = ()) -> str:
+        """
+        Get the digest of all files below the root.
+
+        :param root: The directory to hash
+        :param excludes: The paths relative to the root which are skipped
+        """
+        excludes = set(excludes)
+        hashes = {}
+        h = hashlib.sha256()
+        for rel, path in sorted(_walk(root, excludes)):
+            st = path.stat()
+            old = self.hashes.get(rel)
+            if old is not None and old[0] == st.st_size and \
+                    old[1] == st.st_mtime_ns:
+                hashes[rel] = old
+            else:
+                hashes[rel] = [st.st_size, st.st_mtime_ns, hash_file(path)]
+                self.modified = True
+            h.update(rel.encode())
+            h.update(hashes[rel][2].encode())
+        if hashes.keys() != self.hashes.keys():
+            self.modified = True
+        self.hashes = hashes
+        return h.hexdigest()
+
+    def save(self):
+        """Write the hashes to the disk if they were modified."""
+        if self.path is None or not self.modified:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(self.hashes, f)
+        os.replace(tmp_path, self.path)
+        self.modified = False
+
+
+def hash_file(path: Path) -> str:
+    """Get the sha256 hex digest of the content of a file."""
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def output_paths(dub: DubPackage) -> List[str]:
+    """Get the build outputs of a DUB package relative to its directory."""
+    paths = []
+    for c in dub.configurations:
+        paths.append(c.object_path().as_posix())
+        if c.name is not None:
+            paths.append(dub.test_object_path(c).as_posix())
+    return paths
+
+
+def read_fingerprint(path: Path) -> Optional[str]:
+    """Read the fingerprint of an installed DUB package."""
+    try:
+        return (path / FINGERPRINT_FILE).read_text().strip()
+    except OSError:
+        return None
+
+
+def write_fingerprint(path: Path, fingerprint: str):
+    """Write the fingerprint of an installed DUB package."""
+    (path / FINGERPRINT_FILE).write_text(fingerprint + '\n')
+
+
+def combine(components: Dict) -> str:
+    """Get the fingerprint of a JSON serializable set of components."""
+    data = json.dumps(components, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode()).hexdigest()
+
+
+def read_selections(path: Path) -> Optional[Dict[str, str]]:
+    """
+    Read the registry versions selected in `dub.selections.json`.
+
+    Path dependencies are skipped, since their paths are absolute in the
+    mirror of an isolated build.
+
+    :param path: The directory DUB is invoked in
+    :returns: The versions by package name, or None if there is no file
+    """
+    try:
+        with open(path / 'dub.selections.json', 'r') as f:
+            versions = json.load(f).get('versions', {})
+    except (OSError, ValueError, AttributeError):
+        return None
+    selections = {}
+    for name, spec in versions.items():
+        if isinstance(spec, dict):
+            spec = spec.get('version')
+        if isinstance(spec, str):
+            selections[name] = spec
+    return selections
+
+
+async def get_components(
+    dub: DubPackage, env: Dict, depends: List[DubPackage],
+    dub_args: List[str], source_hashes: SourceHashes,
+    dub_path: Optional[Path] = None
+) -> Dict:
+    """
+    Get the components of the fingerprint of a DUB package.
+
+    :param dub: The DUB package
+    :param env: The environment DUB is invoked with
+    :param depends: The DUB packages provided by colcon it depends on
+    :param dub_args: The arguments passed to DUB
+    :param source_hashes: The cached hashes of the sources of the package
+    :param dub_path: The directory DUB is invoked in, the package directory
+      by default
+    :returns: The JSON serializable components
+    """
+    sources = source_hashes.digest(
+        dub.path, output_paths(dub) + list(GENERATED_FILES))
+    source_hashes.save()
+
+    dependencies = {}
+    for dep in depends:
+        dependencies[dep.name] = read_fingerprint(dep.path) or \
+            SourceHashes().digest(dep.path)
+
+    return {
+        'package': dub.name,
+        'sources': sources,
+        'dub_args': dub_args,
+        'dflags': env.get('DFLAGS'),
+        'compiler': await get_compiler_identity(env, dub_args),
+        'dependencies': dependencies,
+        'selections': read_selections(dub_path or dub.path),
+    }
+
+
+async def get_compiler_identity(env: Dict, dub_args: List[str]) -> str:
+    """
+    Get a string identifying the D compiler used by DUB.
+
+    The compiler is taken from `--compiler` in the DUB arguments, the `DC`
+    environment variable or the first of the compilers DUB searches by
+    default. The identity is the first line of `<compiler> --version`.
+    """
+    compiler = _get_compiler(dub_args) or env.get('DC')
+    if compiler is None:
+        for name in ('dmd', 'ldc2', 'gdc'):
+            if shutil.which(name, path=env.get('PATH')):
+                compiler = name
+                break
+        else:
+            return 'unknown'
+
+    if compiler not in _compiler_identities:
+        identity = compiler
+        try:
+            output = await check_output([compiler, '--version'], env=env)
+            lines = output.decode(errors='replace').splitlines()
+            if lines:
+                identity = lines[0].strip()
+        except (AssertionError, OSError) as e:  # noqa: F841
+            logger.warning(
+                "Failed to get the version of '{compiler}': {e}".format_map(
+                    locals()))
+        _compiler_identities[compiler] = identity
+    return _compiler_identities[compiler]
+
+
+def _get_compiler(dub_args: List[str]) -> Optional[str]:
+    compiler = None
+    for i, arg in enumerate(dub_args):
+        if arg.startswith('--compiler='):
+            compiler = arg[len('--compiler='):]
+        elif arg == '--compiler' and i + 1 < len(dub_args):
+            compiler = dub_args[i + 1]
+    return compiler
+
+
+def _walk(root: Path, excludes):
+    for dirpath, dirnames, filenames in os.walk(root, followlinks=True):
+        rel_dir = Path(dirpath).relative_to(root)
+        if rel_dir == Path('.'):
+            # Skip hidden entries like `.git` or `.dub` in the package root
+            dirnames[:] = [d for d in dirnames if not d.startswith('.')]
+            filenames = [f for f in filenames if not f.startswith('.')]
+        for filename in filenames:
+            rel = (rel_dir / filename).as_posix()
+            if rel in excludes or Path(filename).suffix in OUTPUT_SUFFIXES:
+                continue
+            yield rel, Path(dirpath) / filename
@@ -0,0 +1,138 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+"""
+Keep the identification of packages between colcon invocations.
+
+Every invocation identifies every directory of the workspace, which reads
+and parses each package recipe again. The identified name, type and
+dependencies are stored per directory together with the mtime and size of
+the files they were read from. As long as none of these files changed, the
+recipe isn't read at all. A file which didn't exist is recorded too, so a
+new `dub.json` taking precedence over `dub.sdl` invalidates the entry.
+
+The cache is a single JSON file, written once when colcon exits. It is
+only used if its path is set by `COLCON_DUB_IDENTIFICATION_CACHE`.
+"""
+
+import atexit
+import json
+import os
+import tempfile
+
+from collections import OrderedDict
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+from colcon_core.environment_variable import EnvironmentVariable
+from colcon_core.logging import colcon_logger
+
+IDENTIFICATION_CACHE_ENVIRONMENT_VARIABLE = EnvironmentVariable(
+    'COLCON_DUB_IDENTIFICATION_CACHE',
+    'The file caching the identification of DUB packages between '
+    'invocations, the cache is disabled if it is unset or empty')
+
+logger = colcon_logger.getChild(__name__)
+
+# The maximum number of directories kept in the cache
+IDENTIFICATION_CACHE_SIZE = 16384
+
+_cache = None
+
+
+class IdentificationCache:
+    """This class represents the packages identified by past invocations."""
+
+    __slots__ = (
+        'path',
+        'entries',
+        'dirty'
+    )
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries = OrderedDict()
+        self.dirty = False
+        try:
+            with open(path, 'r') as f:
+                self.entries.update(json.load(f))
+        except (OSError, ValueError, TypeError):
+            pass
+
+    def get(self, key: str, stamps: List) -> Optional[Dict]:
+        """
+        Get the identification of a directory.
+
+        :param key: The extension and the path of the directory
+        :param stamps: The current stamps of the files the identification
+          depends on
+        :returns: The cached data, or None if it is missing or stale
+        """
+        entry = self.entries.get(key)
+        if entry is None or entry.get('stamps') != stamps:
+            return None
+        return entry.get('data')
+
+    def set(self, key: str, stamps: List, data: Dict):
+        """Store the identification of a directory."""
+        self.entries[key] = {'stamps': stamps, 'data': data}
+        self.entries.move_to_end(key)
+        while len(self.entries) > IDENTIFICATION_CACHE_SIZE:
+            self.entries.popitem(last=False)
+        self.dirty = True
+
+    def save(self):
+        """Write the cache if anything changed."""
+        if not self.dirty:
+            return
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp_path = tempfile.mkstemp(
+                prefix='.tmp-', dir=str(self.path.parent))
+            with os.fdopen(fd, 'w') as f:
+                json.dump(self.entries, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:  # noqa: F841
+            logger.warning(
+                "Failed to write the identification cache '{self.path}': "
+                '{e}'.format_map(locals()))
+            return
+        self.dirty = False
+
+
+def get_stamps(path: Path, filenames: Iterable[str]) -> List:
+    """
+    Get the mtime and size of files in a directory.
+
+    :param path: The directory
+    :param filenames: The names of the files
+    :returns: A `[mtime_ns, size]` pair per file, None for missing files
+    """
+    stamps = []
+    for filename in filenames:
+        try:
+            st = os.stat(str(path / filename))
+        except OSError:
+            stamps.append(None)
+            continue
+        stamps.append([st.st_mtime_ns, st.st_size])
+    return stamps
+
+
+def get_identification_cache() -> Optional[IdentificationCache]:
+    """
+    Get the identification cache of this process.
+
+    The cache is read on first use and written when the process exits.
+
+    :returns: The cache, or None if `COLCON_DUB_IDENTIFICATION_CACHE` is
+      unset or empty
+    """
+    global _cache
+    if _cache is None:
+        path = os.environ.get(IDENTIFICATION_CACHE_ENVIRONMENT_VARIABLE.name)
+        if not path:
+            _cache = False
+        else:
+            _cache = IdentificationCache(Path(path))
+            atexit.register(_cache.save)
+    return _cache or None
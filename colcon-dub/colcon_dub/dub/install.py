@@ -0,0 +1,384 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+"""Install files incrementally using a manifest of the previous install."""
+
+import errno
+import fnmatch
+import json
+import os
+import re
+
+from pathlib import Path
+from shutil import copy2
+from shutil import copystat
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from colcon_core.logging import colcon_logger
+
+from colcon_dub.dub import DubPackage
+from colcon_dub.dub.fingerprint import hash_file
+from colcon_dub.dub.fingerprint import OUTPUT_SUFFIXES
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+logger = colcon_logger.getChild(__name__)
+
+INSTALL_MANIFEST_VERSION = 1
+
+# The ways a file can be installed. Hardlinks and reflinks fall back to a copy
+# when the file system doesn't support them.
+INSTALL_MODES = ('copy', 'hardlink', 'reflink', 'symlink')
+
+# Patterns of the package directory which are never installed to
+# `lib/dub/<package>` by default
+DEFAULT_INSTALL_EXCLUDES = (
+    '.git*',
+    '.dub',
+    '*.o',
+    '*.obj',
+    '*.lst',
+)
+
+# ioctl request to share the extents of a file, see ioctl_ficlone(2)
+_FICLONE = 0x40049409
+
+
+class InstallManifest:
+    """
+    This class represents files installed by a previous install step.
+
+    Each entry is keyed by the destination path relative to the install base
+    and records the source path, size, mtime and content hash of the source
+    file at the time it was installed.
+    """
+
+    __slots__ = (
+        'path',
+        'entries'
+    )
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.entries = {}
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        if data.get('version') == INSTALL_MANIFEST_VERSION:
+            self.entries = data.get('files', {})
+
+    def save(self, entries: Dict[str, Dict]):
+        """Replace the recorded entries and write them to the disk."""
+        self.entries = entries
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump(
+                {'version': INSTALL_MANIFEST_VERSION, 'files': entries},
+                f, indent=1, sort_keys=True)
+        os.replace(tmp_path, self.path)
+
+
+class InstallFilter:
+    """
+    This class decides which files of a directory are installed.
+
+    Patterns are matched with `fnmatch` against paths relative to the
+    directory. A pattern without a slash matches the name of a file or
+    directory at any depth, a pattern with a slash matches the whole relative
+    path. Paths matching an include pattern are installed even if they match
+    an exclude pattern. Files inside an excluded directory are never visited.
+    """
+
+    __slots__ = (
+        '_exclude_name',
+        '_exclude_path',
+        '_include_name',
+        '_include_path'
+    )
+
+    def __init__(self, excludes: Iterable[str], includes: Iterable[str] = ()):
+        self._exclude_name, self._exclude_path = _compile(excludes)
+        self._include_name, self._include_path = _compile(includes)
+
+    def is_excluded(self, rel_path: str) -> bool:
+        """Check if a posix path relative to the directory is excluded."""
+        name = rel_path.rsplit('/', 1)[-1]
+        if not (self._exclude_name.match(name) or
+                self._exclude_path.match(rel_path)):
+            return False
+        return not (self._include_name.match(name) or
+                    self._include_path.match(rel_path))
+
+
+def get_output_patterns(dub: DubPackage) -> List[str]:
+    """
+    Get the exclude patterns of DUB caches and build outputs of a package.
+
+    These are `DEFAULT_INSTALL_EXCLUDES`, the build outputs of all
+    configurations and the test executables built by `dub test`.
+
+    :param dub: The DUB package
+    """
+    patterns = list(DEFAULT_INSTALL_EXCLUDES)
+    for c in dub.configurations:
+        target_path = c.target_path.as_posix().strip('/')
+        prefix = '' if target_path == '.' else target_path + '/'
+        patterns += [
+            '/{prefix}{c.target_name}'.format_map(locals()),
+            '/{prefix}{dub.name}-test-*'.format_map(locals()),
+        ]
+        for suffix in sorted(OUTPUT_SUFFIXES):
+            patterns += [
+                '/{prefix}{c.target_name}{suffix}'.format_map(locals()),
+                '/{prefix}lib{c.target_name}{suffix}'.format_map(locals()),
+            ]
+    return patterns
+
+
+def get_install_filter(
+    dub: DubPackage, excludes: Iterable[str] = (),
+    includes: Iterable[str] = ()
+) -> InstallFilter:
+    """
+    Get the filter of the files of a DUB package installed to `lib/dub`.
+
+    Besides the patterns of `get_output_patterns` the `installExclude`
+    patterns of the package are excluded. `installInclude` patterns of the
+    package override them.
+
+    :param dub: The DUB package
+    :param excludes: Additional exclude patterns
+    :param includes: Additional include patterns
+    """
+    patterns = get_output_patterns(dub)
+    patterns += dub.install_excludes
+    patterns += excludes
+    return InstallFilter(
+        patterns, list(dub.install_includes) + list(includes))
+
+
+def collect_files(
+    src_path: Path, dst_path: str,
+    install_filter: Optional[InstallFilter] = None
+) -> Optional[Dict[str, Path]]:
+    """
+    Expand a source file or directory into destination / source pairs.
+
+    Directories are walked recursively like `copy_tree` does.
+
+    :param src_path: The absolute source path
+    :param dst_path: The destination path relative to the install base
+    :param install_filter: The filter of the files of a directory
+    :returns: The mapping from destination to source, or None if the source
+      doesn't exist
+    """
+    if src_path.is_file():
+        return {dst_path: src_path}
+    if not src_path.is_dir():
+        return None
+    files = {}
+    for root, dirnames, filenames in os.walk(src_path, followlinks=True):
+        rel_root = Path(root).relative_to(src_path).as_posix()
+        prefix = '' if rel_root == '.' else rel_root + '/'
+        if install_filter is not None:
+            dirnames[:] = [
+                d for d in dirnames
+                if not install_filter.is_excluded(prefix + d)]
+        for filename in filenames:
+            rel = prefix + filename
+            if install_filter is not None and \
+                    install_filter.is_excluded(rel):
+                continue
+            files['{dst_path}/{rel}'.format_map(locals())] = \
+                Path(root) / filename
+    return files
+
+
+def sync_files(
+    files: Dict[str, Optional[Path]], install_base: Path,
+    manifest: InstallManifest, mode: str = 'copy'
+) -> Tuple[int, int]:
+    """
+    Install files, skipping the ones which are unchanged since last install.
+
+    A file is considered unchanged when the size and mtime of its source
+    match the manifest. When only the mtime differs, the content hash decides
+    whether the file is copied again. Files recorded in the manifest but not
+    requested anymore are removed from the install base.
+
+    Instead of copying, files can be installed as symlinks to the source, as
+    hardlinks or as reflinks (copy-on-write clones). Symlinks and hardlinks
+    already pointing to the source are never installed again.
+
+    :param files: The mapping from destination path relative to the install
+      base to the absolute source path, or None to create an empty file
+    :param install_base: The install base
+    :param manifest: The manifest of the previous install
+    :param mode: One of `INSTALL_MODES`
+    :returns: The number of files installed or created and the number of
+      bytes copied
+    """
+    assert mode in INSTALL_MODES
+
+    entries = {}
+    copied = 0
+    copied_bytes = 0
+    for dst, src in sorted(files.items()):
+        entry, installed, n_bytes = _sync_file(
+            src, install_base / dst, manifest.entries.get(dst), mode)
+        entries[dst] = entry
+        copied += installed
+        copied_bytes += n_bytes
+
+    for dst in manifest.entries.keys() - entries.keys():
+        _remove_stale(install_base, dst)
+
+    manifest.save(entries)
+    return copied, copied_bytes
+
+
+def _sync_file(
+    src: Optional[Path], dst_path: Path, old: Optional[Dict], mode: str
+) -> Tuple[Dict, bool, int]:
+    if src is None:
+        entry = {'src': None, 'size': 0, 'mtime': 0, 'hash': None}
+        if old == entry and dst_path.exists():
+            return entry, False, 0
+        _prepare_destination(dst_path)
+        dst_path.write_bytes(b'')
+        return entry, True, 0
+
+    st = src.stat()
+    entry = {
+        'src': str(src),
+        'size': st.st_size,
+        'mtime': st.st_mtime_ns,
+        'hash': None,
+        'mode': mode,
+    }
+    if old is not None and old.get('mode', 'copy') != mode:
+        old = None
+    if mode in ('symlink', 'hardlink') and old is not None and \
+            _is_linked(src, dst_path, mode):
+        # The destination is the source itself
+        return entry, False, 0
+    if mode != 'symlink' and old is not None and \
+            old['src'] == entry['src'] and \
+            old['size'] == entry['size'] and dst_path.is_file():
+        if old['mtime'] == entry['mtime']:
+            return old, False, 0
+        if old['hash'] is not None:
+            entry['hash'] = hash_file(src)
+            if old['hash'] == entry['hash']:
+                return entry, False, 0
+    # Links and clones are cheaper to recreate than to hash the source
+    if entry['hash'] is None and mode == 'copy':
+        entry['hash'] = hash_file(src)
+
+    logger.info("'{src}' -> '{dst_path}'".format_map(locals()))
+    _prepare_destination(dst_path)
+    if install_file(src, dst_path, mode) == 'copy':
+        return entry, True, entry['size']
+    return entry, True, 0
+
+
+def install_file(src: Path, dst: Path, mode: str = 'copy') -> str:
+    """
+    Install a single file.
+
+    The destination must not exist.
+
+    :param src: The source file
+    :param dst: The destination file
+    :param mode: One of `INSTALL_MODES`
+    :returns: The mode actually used, which is `copy` when a hardlink or
+      reflink isn't supported
+    """
+    if mode == 'symlink':
+        os.symlink(src.absolute(), dst)
+        return mode
+    if mode == 'hardlink':
+        try:
+            os.link(src, dst)
+            return mode
+        except OSError as e:  # noqa: F841
+            logger.debug(
+                "Failed to hardlink '{src}', copying it: {e}".format_map(
+                    locals()))
+    elif mode == 'reflink':
+        if _reflink(src, dst):
+            return mode
+    copy2(src, dst)
+    return 'copy'
+
+
+def _reflink(src: Path, dst: Path) -> bool:
+    if fcntl is None:
+        return False
+    try:
+        with open(src, 'rb') as fsrc, open(dst, 'wb') as fdst:
+            fcntl.ioctl(fdst.fileno(), _FICLONE, fsrc.fileno())
+    except OSError as e:
+        if e.errno not in (
+            errno.EOPNOTSUPP, errno.EXDEV, errno.EINVAL, errno.ENOTTY,
+            errno.EBADF, errno.EPERM
+        ):
+            raise
+        dst.unlink()
+        return False
+    copystat(src, dst)
+    return True
+
+
+def _is_linked(src: Path, dst: Path, mode: str) -> bool:
+    try:
+        if mode == 'symlink':
+            return dst.is_symlink() and \
+                os.readlink(dst) == str(src.absolute())
+        return not dst.is_symlink() and os.path.samefile(src, dst)
+    except OSError:
+        return False
+
+
+def _prepare_destination(dst: Path):
+    dst.parent.mkdir(parents=True, exist_ok=True)
+    # Never write through the destination, it may be a link to the source
+    if dst.is_symlink() or dst.exists():
+        dst.unlink()
+
+
+def _compile(patterns: Iterable[str]):
+    # Combine the patterns into one regular expression for names and one for
+    # relative paths. A leading slash only anchors the pattern.
+    names = []
+    paths = []
+    for pattern in patterns:
+        if '/' in pattern:
+            paths.append(fnmatch.translate(pattern.lstrip('/')))
+        else:
+            names.append(fnmatch.translate(pattern))
+    return (
+        re.compile('|'.join(names) or '(?!)'),
+        re.compile('|'.join(paths) or '(?!)'))
+
+
+def _remove_stale(install_base: Path, dst: str):
+    dst_path = install_base / dst
+    logger.info("Removing stale '{dst_path}'".format_map(locals()))
+    try:
+        dst_path.unlink()
+    except FileNotFoundError:
+        pass
+    # Remove directories which became empty, up to the install base
+    parent = dst_path.parent
+    while parent != install_base and install_base in parent.parents:
+        try:
+            parent.rmdir()
+        except OSError:
+            break
+        parent = parent.parent
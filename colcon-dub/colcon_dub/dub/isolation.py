@@ -0,0 +1,231 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+"""
+Build DUB packages without writing to their source directory.
+
+The package directory is mirrored into the build directory with symlinks and
+DUB is invoked in the mirror. The `.dub` cache, the build outputs and
+`local-packages.json` are written to the mirror, while the sources are read
+through the symlinks. The package recipe and `dub.selections.json` are
+copied, since DUB may rewrite them. Directories containing a `targetPath`
+are created as real directories, so outputs are never written through a
+symlink.
+
+Relative paths leaving the package directory, like `../common` in
+`sourcePaths` or a path dependency, would be resolved relative to the
+mirror. They are made absolute in the copied `dub.json` and
+`dub.selections.json`. A `dub.sdl` using such paths is rejected, since it
+can't be rewritten.
+"""
+
+import json
+import os
+import shutil
+
+from pathlib import Path
+from typing import Dict, List, Optional, Set
+
+from colcon_dub.dub import DubPackage
+from colcon_dub.dub.install import get_output_patterns
+from colcon_dub.dub.install import InstallFilter
+from colcon_dub.dub.sdl import load_sdl
+
+# The directory of the mirror relative to the build base
+ISOLATED_PACKAGE_PATH = Path('colcon_dub') / 'package'
+
+# Files of the package directory which are copied instead of linked
+COPIED_FILES = ('dub.json', 'dub.sdl', 'dub.selections.json')
+
+# Recipe directives containing paths relative to the package directory
+PATH_DIRECTIVES = {
+    'sourcePaths',
+    'importPaths',
+    'stringImportPaths',
+    'cImportPaths',
+    'sourceFiles',
+    'excludedSourceFiles',
+    'copyFiles',
+    'extraDependencyFiles',
+    'mainSourceFile',
+}
+
+
+def get_isolated_path(build_base: Path) -> Optional[Path]:
+    """
+    Get the mirror of a package created by an isolated build.
+
+    :param build_base: The build base of the package
+    :returns: The path of the mirror, or None if the package was built in
+      its source directory
+    """
+    path = build_base / ISOLATED_PACKAGE_PATH
+    return path if path.is_dir() else None
+
+
+def mirror_package(dub: DubPackage, build_base: Path) -> Path:
+    """
+    Create or update the mirror of a package in its build base.
+
+    Existing DUB caches and outputs of the mirror are kept.
+
+    :param dub: The DUB package
+    :param build_base: The build base of the package
+    :returns: The path of the mirror
+    :raises RuntimeError: if `dub.sdl` contains relative paths leaving the
+      package directory
+    """
+    if not (dub.path / 'dub.json').exists():
+        outside = _make_paths_absolute(
+            load_sdl(dub.path / 'dub.sdl'), dub.path)
+        if outside:
+            raise RuntimeError(
+                "Can't build '{dub.name}' isolated, since dub.sdl refers to "
+                'paths outside of the package directory: {paths}. Use '
+                'absolute paths or build without --dub-isolated-build'
+                .format(dub=dub, paths=', '.join(outside)))
+
+    path = build_base / ISOLATED_PACKAGE_PATH
+    real_dirs = set()
+    for c in dub.configurations:
+        if c.target_path.is_absolute():
+            continue
+        parts = c.target_path.parts
+        for i in range(1, len(parts) + 1):
+            real_dirs.add(Path(*parts[:i]).as_posix())
+    _mirror(
+        dub.path, path, '', real_dirs,
+        InstallFilter(get_output_patterns(dub)))
+    return path
+
+
+def remove_mirror(build_base: Path):
+    """Remove the mirror of a package created by an isolated build."""
+    path = build_base / ISOLATED_PACKAGE_PATH
+    if path.is_dir():
+        shutil.rmtree(path)
+
+
+def _mirror(
+    src: Path, dst: Path, prefix: str, real_dirs: Set[str],
+    output_filter: InstallFilter
+):
+    dst.mkdir(parents=True, exist_ok=True)
+    names = set()
+    for entry in os.scandir(src):
+        rel = prefix + entry.name
+        # Outputs of previous builds in the source directory would be
+        # overwritten through the symlink
+        if output_filter.is_excluded(rel):
+            continue
+        names.add(entry.name)
+        target = dst / entry.name
+        if rel in real_dirs and entry.is_dir():
+            if target.is_symlink():
+                target.unlink()
+            _mirror(
+                Path(entry.path), target, rel + '/', real_dirs,
+                output_filter)
+        elif not prefix and entry.name in COPIED_FILES:
+            _copy_if_changed(Path(entry.path), target, src)
+        else:
+            _link(Path(entry.path), target)
+
+    # Remove what doesn't exist in the source directory anymore. Real files
+    # and directories are outputs of DUB.
+    for entry in os.scandir(dst):
+        if entry.name in names:
+            continue
+        if entry.is_symlink() or (
+                not prefix and entry.name in COPIED_FILES):
+            os.unlink(entry.path)
+
+
+def _link(src: Path, dst: Path):
+    if dst.is_symlink():
+        if os.readlink(dst) == str(src):
+            return
+        dst.unlink()
+    elif dst.is_dir():
+        shutil.rmtree(dst)
+    elif dst.exists():
+        dst.unlink()
+    os.symlink(src, dst)
+
+
+def _copy_if_changed(src: Path, dst: Path, package_path: Path):
+    if dst.is_symlink():
+        dst.unlink()
+    content = src.read_bytes()
+    rewritten = content
+    if src.suffix == '.json':
+        rewritten = _rewrite_json(content, package_path)
+    if dst.is_file() and dst.read_bytes() == rewritten:
+        return
+    if rewritten is content:
+        shutil.copy2(src, dst)
+    else:
+        dst.write_bytes(rewritten)
+
+
+def _rewrite_json(content: bytes, package_path: Path) -> bytes:
+    try:
+        data = json.loads(content.decode())
+    except ValueError:
+        # Let DUB report the error
+        return content
+    if not isinstance(data, dict):
+        return content
+    if 'versions' in data:  # dub.selections.json
+        changed = _make_paths_absolute(
+            {'dependencies': data['versions']}, package_path)
+    else:
+        changed = _make_paths_absolute(data, package_path)
+    if not changed:
+        return content
+    return (json.dumps(data, indent=4) + '\n').encode()
+
+
+def _make_paths_absolute(recipe: Dict, package_path: Path) -> List[str]:
+    """
+    Make the relative paths of a recipe leaving the package absolute.
+
+    :param recipe: The recipe, modified in place
+    :param package_path: The directory the paths are relative to
+    :returns: The original paths which were replaced
+    """
+    replaced = []
+
+    def absolute(path):
+        if not isinstance(path, str) or os.path.isabs(path):
+            return path
+        normalized = os.path.normpath(path)
+        if normalized != os.pardir and \
+                not normalized.startswith(os.pardir + os.sep):
+            return path
+        replaced.append(path)
+        return os.path.normpath(os.path.join(str(package_path), path))
+
+    for key, value in recipe.items():
+        # Directives can have a platform suffix like sourcePaths-posix
+        directive = key.split('-', 1)[0]
+        if directive in PATH_DIRECTIVES:
+            if isinstance(value, list):
+                recipe[key] = [absolute(v) for v in value]
+            else:
+                recipe[key] = absolute(value)
+        elif directive == 'dependencies' and isinstance(value, dict):
+            for spec in value.values():
+                if isinstance(spec, dict) and 'path' in spec:
+                    spec['path'] = absolute(spec['path'])
+        elif directive in ('configurations', 'subPackages') and \
+                isinstance(value, list):
+            for i, item in enumerate(value):
+                if isinstance(item, dict):
+                    replaced += _make_paths_absolute(item, package_path)
+                else:
+                    value[i] = absolute(item)
+        elif directive == 'buildTypes' and isinstance(value, dict):
+            for item in value.values():
+                if isinstance(item, dict):
+                    replaced += _make_paths_absolute(item, package_path)
+    return replaced
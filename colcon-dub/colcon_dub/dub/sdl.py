@@ -0,0 +1,278 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+"""
+Read `dub.sdl` package files.
+
+The package file is parsed as SDLang and converted to the structure of the
+equivalent `dub.json`, so `DubPackage` handles both formats the same way.
+Only the values DUB recipes use are supported: strings, numbers, booleans
+and null. Dates, times and binary values are rejected.
+
+The colcon specific directives take the destination as first value,
+followed by the files:
+
+    installFiles "share/$DUB_PACKAGE" "package.xml" "launch"
+    createFiles "share/ament_index/resource_index/packages" "$DUB_PACKAGE"
+"""
+
+import re
+import string
+
+from pathlib import Path
+from typing import Dict, List
+
+# Directives which are strings in `dub.json`. All other directives are lists.
+STRING_DIRECTIVES = {
+    'name',
+    'description',
+    'homepage',
+    'license',
+    'copyright',
+    'version',
+    'targetType',
+    'targetName',
+    'targetPath',
+    'workingDirectory',
+    'mainSourceFile',
+    'systemDependencies',
+    'ddoxTool',
+}
+
+# Every match is one token preceded by optional whitespace, comments and line
+# continuations. The empty match at the end of the document is the end of
+# file.
+_TOKEN = re.compile(r'''
+(?:[ \t\f\r]+|/\*.*?\*/|(?://|\#|--)[^\n]*|\\[ \t\r]*\n)*
+(
+    \n
+  | "[^"\\\n]*(?:\\(?:.|\n)[^"\\\n]*)*"
+  | [^\s{};="`/\#\\]+
+  | [{};=]
+  | `[^`]*`
+  | $
+  | .
+)''', re.VERBOSE | re.DOTALL)
+
+_IDENTIFIER = re.compile(r'[A-Za-z_$][\w.$:-]*')
+_IDENTIFIER_START = frozenset(string.ascii_letters + '_$')
+
+_NUMBER = re.compile(r'([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)(L|f|d|BD)?',
+                     re.IGNORECASE)
+
+_ESCAPES = {
+    'n': '\n',
+    'r': '\r',
+    't': '\t',
+    '"': '"',
+    '\\': '\\',
+}
+
+_KEYWORDS = {
+    'true': True,
+    'on': True,
+    'false': False,
+    'off': False,
+    'null': None,
+}
+
+
+class SdlTag:
+    """This class represents a tag of a SDLang document."""
+
+    __slots__ = (
+        'name',
+        'values',
+        'attributes',
+        'children'
+    )
+
+    def __init__(self, name: str):
+        self.name = name
+        self.values = []
+        self.attributes = {}
+        self.children = []
+
+
+def parse_sdl(text: str) -> List[SdlTag]:
+    """
+    Parse a SDLang document.
+
+    :param text: The content of the document
+    :returns: The top level tags
+    """
+    return _parse(text)
+
+
+def load_sdl(path: Path) -> Dict:
+    """
+    Read a `dub.sdl` and convert it to the structure of `dub.json`.
+
+    :param path: The path to the `dub.sdl`
+    :returns: The equivalent content of `dub.json`
+    """
+    with open(path, 'r') as f:
+        text = f.read()
+    try:
+        return to_json(parse_sdl(text))
+    except RuntimeError as e:  # noqa: F841
+        raise RuntimeError("Failed to parse '{path}': {e}".format_map(
+            locals())) from None
+
+
+def to_json(tags: List[SdlTag]) -> Dict:
+    """Convert the tags of a DUB recipe to the structure of `dub.json`."""
+    recipe = {}
+    for tag in tags:
+        name = tag.name
+        values = tag.values
+        if name == 'configuration':
+            config = to_json(tag.children)
+            config['name'] = _first(tag)
+            recipe.setdefault('configurations', []).append(config)
+        elif name == 'buildType':
+            recipe.setdefault('buildTypes', {})[_first(tag)] = \
+                to_json(tag.children)
+        elif name == 'subPackage':
+            recipe.setdefault('subPackages', []).append(
+                to_json(tag.children) if tag.children else _first(tag))
+        elif name == 'dependency':
+            spec = dict(tag.attributes)
+            if list(spec.keys()) == ['version']:
+                spec = spec['version']
+            recipe.setdefault('dependencies', {})[_first(tag)] = spec
+        elif name == 'subConfiguration':
+            if len(values) != 2:
+                raise RuntimeError(
+                    "'subConfiguration' requires two values")
+            recipe.setdefault('subConfigurations', {})[values[0]] = \
+                values[1]
+        elif name in ('installFiles', 'createFiles'):
+            recipe.setdefault(name, {}).setdefault(_first(tag), []).extend(
+                values[1:])
+        else:
+            if 'platform' in tag.attributes:
+                name += '-' + tag.attributes['platform']
+            if tag.name in STRING_DIRECTIVES:
+                recipe[name] = _first(tag)
+            else:
+                recipe.setdefault(name, []).extend(values)
+    return recipe
+
+
+def _first(tag: SdlTag):
+    if not tag.values:
+        raise RuntimeError(
+            "'{tag.name}' requires a value".format_map(locals()))
+    return tag.values[0]
+
+
+def _parse(text: str) -> List[SdlTag]:
+    tokens = _TOKEN.findall(text)
+
+    def error(message: str, index: int):
+        # Count the lines up to the current token only to report it
+        line = 1
+        for m in _TOKEN.finditer(text):
+            index -= 1
+            if index <= 0:
+                break
+            line += m.group().count('\n')
+        raise RuntimeError(
+            '{message} at line {line}'.format_map(locals()))
+
+    def value(t: str, index: int):
+        c = t[:1]
+        if c == '"' and len(t) > 1:
+            return _unescape(t[1:-1]) if '\\' in t else t[1:-1]
+        if c == '`' and len(t) > 1:
+            return t[1:-1]
+        if t in _KEYWORDS:
+            return _KEYWORDS[t]
+        m = _NUMBER.fullmatch(t)
+        if m:
+            if m.group(2) and m.group(2).lower() == 'l' or \
+                    '.' not in t and 'e' not in t.lower():
+                return int(m.group(1))
+            return float(m.group(1))
+        if t == '' or t == '\n':
+            error('Expected a value', index)
+        error("Unsupported syntax '{t}'".format_map(locals()), index)
+
+    root = []
+    parents = []
+    tags = root
+    tag = None
+    i = 0
+    while True:
+        t = tokens[i]
+        i += 1
+        if tag is None:
+            if t == '\n' or t == ';':
+                continue
+            if t == '':
+                break
+            if t == '}':
+                if not parents:
+                    error("Unexpected '}'", i)
+                tags = parents.pop()
+                continue
+            if t[0] in _IDENTIFIER_START and t not in _KEYWORDS and \
+                    _IDENTIFIER.fullmatch(t):
+                tag = SdlTag(t)
+                tags.append(tag)
+                continue
+            # An anonymous tag starts with a value
+            tag = SdlTag('')
+            tags.append(tag)
+
+        if t[:1] == '"' and len(t) > 1 and not tag.attributes:
+            tag.values.append(_unescape(t[1:-1]) if '\\' in t else t[1:-1])
+        elif t == '\n' or t == ';':
+            tag = None
+        elif t == '' or t == '}':
+            # The end of file or the block of the parent ends the tag
+            tag = None
+            i -= 1
+        elif t == '{':
+            parents.append(tags)
+            tags = tag.children
+            tag = None
+        elif t not in _KEYWORDS and _IDENTIFIER.fullmatch(t):
+            if tokens[i] != '=':
+                error("Unexpected identifier '{t}'".format_map(locals()), i)
+            tag.attributes[t] = value(tokens[i + 1], i + 2)
+            i += 2
+        elif tag.attributes:
+            error('Values must precede attributes', i)
+        else:
+            tag.values.append(value(t, i))
+
+    if parents:
+        error("Missing '}'", i)
+    return root
+
+
+def _unescape(value: str) -> str:
+    if '\\' not in value:
+        return value
+    result = []
+    i = 0
+    while i < len(value):
+        c = value[i]
+        if c != '\\':
+            result.append(c)
+            i += 1
+            continue
+        escaped = value[i + 1]
+        if escaped == '\n':
+            # Line continuation skips the leading whitespace of the next line
+            i += 2
+            while i < len(value) and value[i] in ' \t':
+                i += 1
+            continue
+        if escaped not in _ESCAPES:
+            raise RuntimeError(
+                "Unknown escape sequence '\\{escaped}'".format_map(locals()))
+        result.append(_ESCAPES[escaped])
+        i += 2
+    return ''.join(result)
@@ -0,0 +1,398 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+"""
+Select, build, split and report the unittests of DUB packages.
+
+A shard is selected by passing `-i REGEX` to the test runner, which is
+understood by runners like `silly`. The regular expression matches the names
+of the tests of the modules assigned to the shard.
+
+The output of `silly` is converted to JUnit XML with one test case per
+unittest. The output of other test runners becomes a single test case.
+
+The build task can build the unittest executables, which are stored in the
+build directory together with the fingerprint they were built from. The test
+task runs them directly as long as the fingerprint is unchanged. Only
+`dub test` generates the test runner and it always runs the executable, so
+the build task passes a main file whose module constructor exits before
+druntime runs the unittests when `COLCON_DUB_BUILD_ONLY` is set.
+"""
+
+import json
+import os
+import re
+from shutil import copy2
+from xml.etree import ElementTree
+
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from colcon_dub.dub import DubConfiguration
+from colcon_dub.dub import DubPackage
+from colcon_dub.dub.fingerprint import combine
+from colcon_dub.dub.fingerprint import get_components
+from colcon_dub.dub.fingerprint import SourceHashes
+
+# The variable making the executables built with the main file exit before
+# running the unittests
+BUILD_ONLY_ENV = 'COLCON_DUB_BUILD_ONLY'
+
+# The main file of the executables built by the build task, which behaves
+# like the one generated by DUB unless BUILD_ONLY_ENV is set
+TEST_MAIN = """\
+module colcon_dub_test_main;
+
+shared static this()
+{
+    import core.stdc.stdlib : exit, getenv;
+
+    // Module constructors run before the unittests
+    if (getenv("COLCON_DUB_BUILD_ONLY") !is null)
+        exit(0);
+}
+
+int main()
+{
+    import core.stdc.stdio : puts;
+
+    puts("All unit tests have been run successfully.");
+    return 0;
+}
+"""
+
+# A result line of silly, optionally with the duration of `-v`
+_SILLY_RESULT = re.compile(
+    r'^\s*(\u2713|\u2717)\s+(\S+)\s+(.*?)'
+    r'(?:\s+\((\d+(?:\.\d+)?)\s*ms\))?\s*$')
+_SILLY_SUMMARY = re.compile(r'^\s*Summary:\s+\d+ passed')
+_ANSI_ESCAPE = re.compile(r'\x1b\[[0-9;]*m')
+
+_MODULE = re.compile(
+    r'^\s*module\s+([A-Za-z_][\w]*(?:\s*\.\s*[A-Za-z_]\w*)*)\s*;',
+    re.MULTILINE)
+
+
+class CachedTestResult:
+    """
+    This class represents the result of the last test run of a package.
+
+    The result is reused as long as the fingerprint of the package, its
+    dependencies, the DUB arguments and the tested configurations are
+    unchanged.
+    """
+
+    __slots__ = (
+        'path',
+        'fingerprint',
+        'returncode',
+        'output'
+    )
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.fingerprint = None
+        self.returncode = None
+        self.output = ''
+        try:
+            with open(path, 'r') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.fingerprint = data.get('fingerprint')
+        self.returncode = data.get('returncode')
+        self.output = data.get('output', '')
+
+    def save(
+        self, fingerprint: str, returncode: Optional[int],
+        log_paths: List[Path]
+    ):
+        """Record the result and the output of a test run."""
+        output = []
+        for log_path in log_paths:
+            try:
+                output.append(log_path.read_text(errors='replace'))
+            except OSError:
+                pass
+        self.fingerprint = fingerprint
+        self.returncode = returncode
+        self.output = ''.join(output)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_name(self.path.name + '.tmp')
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'fingerprint': fingerprint,
+                'returncode': returncode,
+                'output': self.output,
+            }, f)
+        os.replace(tmp_path, self.path)
+
+
+def get_test_configurations(
+    dub: DubPackage, names: Optional[List[str]] = None
+) -> List[Optional[str]]:
+    """
+    Get the configurations of a DUB package to test.
+
+    :param dub: The DUB package
+    :param names: The configurations chosen by the user
+    :returns: The configurations whose name starts with `unittest`, or None
+      to let `dub test` choose the configuration if there is none
+    """
+    if names:
+        return names
+    configs = [
+        c.name for c in dub.configurations
+        if c.name is not None and c.name.startswith('unittest')]
+    return configs or [None]
+
+
+async def get_test_binary_fingerprints(
+    dub: DubPackage, env: Dict, depends: List[DubPackage],
+    configs: List[str], source_hashes: SourceHashes,
+    dub_args: Optional[List[str]] = None, dub_path: Optional[Path] = None
+) -> Dict[str, str]:
+    """
+    Get the fingerprints of the unittest executables of a DUB package.
+
+    The executables are built without the arguments of `--dub-args`, so the
+    build and the test task compute the same fingerprints.
+
+    :param dub_args: The DUB options the executables are built with, like
+      the compiler
+    :param dub_path: The directory DUB is invoked in, the package directory
+      by default
+    :returns: The fingerprint per configuration
+    """
+    components = await get_components(
+        dub, env, depends, dub_args or [], source_hashes, dub_path)
+    fingerprints = {}
+    for config in configs:
+        components['test_configuration'] = config
+        fingerprints[config] = combine(components)
+    return fingerprints
+
+
+def write_test_main(path: Path) -> Path:
+    """
+    Write the main file of the unittest executables built by the build task.
+
+    The file is only written if it changed, so DUB doesn't rebuild the
+    executables.
+
+    :param path: The directory to write the file to
+    :returns: The path of the file
+    """
+    main_file = path / 'colcon_dub_test_main.d'
+    try:
+        if main_file.read_text() == TEST_MAIN:
+            return main_file
+    except OSError:
+        pass
+    path.mkdir(parents=True, exist_ok=True)
+    main_file.write_text(TEST_MAIN)
+    return main_file
+
+
+def store_test_binary(
+    path: Path, dub: DubPackage, config: str, fingerprint: str,
+    dub_path: Optional[Path] = None
+) -> bool:
+    """
+    Copy the unittest executable built by `dub test` to a directory.
+
+    :param path: The directory to store the executable in
+    :param dub: The DUB package
+    :param config: The tested configuration
+    :param fingerprint: The fingerprint of the executable
+    :param dub_path: The directory DUB was invoked in, the package
+      directory by default
+    :returns: False if `dub test` didn't produce the executable
+    """
+    object_path = dub.test_object_path(_get_configuration(dub, config))
+    name = object_path.name
+    src = (dub_path or dub.path) / object_path
+    if not src.is_file():
+        return False
+    path.mkdir(parents=True, exist_ok=True)
+    fingerprint_path = path / (name + '.fingerprint')
+    if fingerprint_path.exists():
+        fingerprint_path.unlink()
+    copy2(src, path / name)
+    fingerprint_path.write_text(fingerprint)
+    return True
+
+
+def find_test_binary(
+    path: Path, dub: DubPackage, config: str, fingerprint: str
+) -> Optional[Path]:
+    """
+    Find a stored unittest executable which is up to date.
+
+    :param path: The directory the executables are stored in
+    :param dub: The DUB package
+    :param config: The tested configuration
+    :param fingerprint: The current fingerprint of the executable
+    :returns: The path of the executable, or None if it is missing or stale
+    """
+    name = dub.test_object_path(_get_configuration(dub, config)).name
+    try:
+        recorded = (path / (name + '.fingerprint')).read_text()
+    except OSError:
+        return None
+    if recorded != fingerprint or not (path / name).is_file():
+        return None
+    return path / name
+
+
+def find_modules(dub: DubPackage) -> List[str]:
+    """
+    Find the D modules in the source paths of a DUB package.
+
+    The name of a module is read from its module declaration, or derived from
+    its path when it has none.
+
+    :param dub: The DUB package
+    :returns: The sorted module names
+    """
+    modules = set()
+    for source_path in dub.source_paths:
+        root = dub.path / source_path
+        for dirpath, _, filenames in os.walk(root):
+            for filename in filenames:
+                if not filename.endswith(('.d', '.di')):
+                    continue
+                path = Path(dirpath) / filename
+                modules.add(_module_name(path, root))
+    return sorted(modules)
+
+
+def shard_filters(modules: List[str], shards: int) -> List[str]:
+    """
+    Get the test runner filters of the shards of a list of modules.
+
+    Modules are assigned to the shards round-robin. Shards without any module
+    are omitted. The filter of a module doesn't match the tests of the
+    modules nested in it.
+
+    :param modules: The module names
+    :param shards: The number of shards
+    :returns: A regular expression per shard
+    """
+    patterns = {}
+    for module in modules:
+        nested = [
+            re.escape(m[len(module) + 1:]) for m in modules
+            if m.startswith(module + '.')]
+        pattern = re.escape(module) + '\\.'
+        if nested:
+            pattern += '(?!(?:{nested})\\.)'.format(nested='|'.join(nested))
+        patterns[module] = pattern
+
+    filters = []
+    for i in range(shards):
+        names = modules[i::shards]
+        if names:
+            filters.append('^(?:{patterns})'.format(
+                patterns='|'.join(patterns[name] for name in names)))
+    return filters
+
+
+def _get_configuration(dub: DubPackage, name: str) -> DubConfiguration:
+    for c in dub.configurations:
+        if c.name == name:
+            return c
+    return DubConfiguration({'name': name, 'targetType': 'library'})
+
+
+def _module_name(path: Path, root: Path) -> str:
+    try:
+        with open(path, 'r', errors='replace') as f:
+            m = _MODULE.search(f.read())
+    except OSError:
+        m = None
+    if m:
+        return re.sub(r'\s+', '', m.group(1))
+    parts = list(path.relative_to(root).with_suffix('').parts)
+    if len(parts) > 1 and parts[-1] == 'package':
+        parts.pop()
+    return '.'.join(parts)
+
+
+def parse_silly_output(output: str) -> List[dict]:
+    """
+    Parse the results of the unittests from the output of `silly`.
+
+    :param output: The output of the test executable
+    :returns: A dictionary per unittest with the keys `module`, `name`,
+      `passed`, `seconds` (None without `-v`) and `details`
+    """
+    results = []
+    for line in _ANSI_ESCAPE.sub('', output).splitlines():
+        m = _SILLY_RESULT.match(line)
+        if m:
+            results.append({
+                'module': m.group(2),
+                'name': m.group(3),
+                'passed': m.group(1) == '\u2713',
+                'seconds':
+                    float(m.group(4)) / 1000 if m.group(4) else None,
+                'details': [],
+            })
+        elif _SILLY_SUMMARY.match(line):
+            break
+        elif results and not results[-1]['passed'] and line.strip():
+            # The exception and stack trace of the failed unittest
+            results[-1]['details'].append(line.strip())
+    return results
+
+
+def write_junit(
+    path: Path, suite: str, output: str, returncode: Optional[int],
+    seconds: float
+):
+    """
+    Write the result of a test run as JUnit XML.
+
+    :param path: The XML file
+    :param suite: The name of the test suite
+    :param output: The output of the test run
+    :param returncode: The return code of the test run
+    :param seconds: The duration of the test run
+    """
+    results = parse_silly_output(output)
+    if not results:
+        # Only the result of the whole run is known
+        results = [{
+            'module': suite,
+            'name': 'unittest',
+            'passed': not returncode,
+            'seconds': seconds,
+            'details': _ANSI_ESCAPE.sub('', output).splitlines(),
+        }]
+
+    failures = sum(not r['passed'] for r in results)
+    testsuites = ElementTree.Element('testsuites')
+    testsuite = ElementTree.SubElement(testsuites, 'testsuite', {
+        'name': suite,
+        'tests': str(len(results)),
+        'failures': str(failures),
+        'errors': '0',
+        'skipped': '0',
+        'time': '{seconds:.3f}'.format_map(locals()),
+    })
+    for r in results:
+        testcase = ElementTree.SubElement(testsuite, 'testcase', {
+            'classname': r['module'],
+            'name': r['name'],
+            'time': '{t:.6f}'.format(t=r['seconds'] or 0),
+        })
+        if not r['passed']:
+            details = '\n'.join(r['details'])
+            failure = ElementTree.SubElement(testcase, 'failure', {
+                'message': details.split('\n', 1)[0] or 'failed',
+            })
+            failure.text = details
+
+    path.parent.mkdir(parents=True, exist_ok=True)
+    ElementTree.ElementTree(testsuites).write(
+        str(path), encoding='utf-8', xml_declaration=True)
@@ -0,0 +1,99 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+"""Measure the phases of DUB tasks and report them as JSON or CSV."""
+
+import csv
+import json
+import os
+import time
+
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Optional
+
+# The columns of the CSV report in order
+REPORT_FIELDS = (
+    'package',
+    'task',
+    'phase',
+    'configuration',
+    'shard',
+    'seconds',
+    'subprocess_seconds',
+    'bytes_copied',
+    'files_copied',
+    'cache_hit',
+)
+
+
+class PhaseTimer:
+    """This class collects the wall time of each phase of a task."""
+
+    __slots__ = (
+        'package',
+        'task',
+        'records'
+    )
+
+    def __init__(self, package: str, task: str):
+        self.package = package
+        self.task = task
+        self.records = []
+
+    @contextmanager
+    def phase(
+        self, name: str, configuration: Optional[str] = None,
+        shard: Optional[int] = None
+    ):
+        """
+        Measure the enclosed block as one phase.
+
+        The yielded record can be extended with additional measurements like
+        `subprocess_seconds` or `bytes_copied`.
+
+        :param name: The name of the phase
+        :param configuration: The DUB configuration the phase belongs to
+        :param shard: The index of the test shard the phase belongs to
+        """
+        record = {
+            'package': self.package,
+            'task': self.task,
+            'phase': name,
+            'configuration': configuration,
+        }
+        if shard is not None:
+            record['shard'] = shard
+        start = time.monotonic()
+        try:
+            yield record
+        finally:
+            record['seconds'] = round(time.monotonic() - start, 6)
+            self.records.append(record)
+
+    @contextmanager
+    def subprocess(self, record: Dict):
+        """Add the wall time of the enclosed block to a record."""
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            record['subprocess_seconds'] = round(
+                record.get('subprocess_seconds', 0) +
+                time.monotonic() - start, 6)
+
+    def write_json(self, path: Path):
+        """Write all records of the task to a JSON file."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(self.records, f, indent=2)
+
+    def append_csv(self, path: Path):
+        """Append all records to a CSV file shared by all packages."""
+        path.parent.mkdir(parents=True, exist_ok=True)
+        new_file = not path.exists() or os.path.getsize(path) == 0
+        with open(path, 'a', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=REPORT_FIELDS)
+            if new_file:
+                writer.writeheader()
+            for record in self.records:
+                writer.writerow(record)
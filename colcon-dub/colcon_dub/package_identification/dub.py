@@ -1,11 +1,17 @@
 # Copyright 2021 nonanonno
 # Licensed under the Apache License, Version 2.0
 
+from colcon_core.dependency_descriptor import DependencyDescriptor
 from colcon_core.package_identification \
     import PackageIdentificationExtensionPoint
 from colcon_core.package_identification import PackageDescriptor
 from colcon_core.plugin_system import satisfies_version
 from colcon_dub.dub import DubPackage
+from colcon_dub.dub.identification_cache import get_identification_cache
+from colcon_dub.dub.identification_cache import get_stamps
+
+# The files a DUB package is identified by, in order of precedence
+DUB_MANIFESTS = ('dub.json', 'dub.sdl')
 
 
 class DubPackageIdentification(PackageIdentificationExtensionPoint):
@@ -23,12 +29,33 @@ class DubPackageIdentification(PackageIdentificationExtensionPoint):
             # This package was already identified as another package type
             return
 
-        dub_package = DubPackage.load(desc.path)
-        if not dub_package:
+        stamps = get_stamps(desc.path, DUB_MANIFESTS)
+        if not any(stamps):
             return
 
-        if desc.name is not None and desc.name != dub_package.name:
+        cache = get_identification_cache()
+        key = 'dub:{path}'.format(path=desc.path.absolute())
+        data = cache.get(key, stamps) if cache else None
+        if data is None:
+            dub_package = DubPackage.load(desc.path)
+            if not dub_package:
+                return
+            data = {
+                'name': dub_package.name,
+                'dependencies': sorted(
+                    name for name in dub_package.dependencies
+                    if name != dub_package.name),
+            }
+            if cache:
+                cache.set(key, stamps, data)
+
+        if desc.name is not None and desc.name != data['name']:
             raise RuntimeError('Package name already set to different value')
 
-        desc.name = dub_package.name
+        desc.name = data['name']
         desc.type = 'dub'
+
+        # Dependencies which are not in the workspace are ignored by colcon
+        for dep_type in ('build', 'run', 'test'):
+            desc.dependencies[dep_type] |= {
+                DependencyDescriptor(name) for name in data['dependencies']}
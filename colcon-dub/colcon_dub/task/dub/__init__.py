@@ -0,0 +1,91 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+"""Helpers shared by the DUB tasks."""
+
+from pathlib import Path
+from typing import List
+
+from colcon_core.event.command import Command
+from colcon_core.event.command import CommandEnded
+from colcon_core.event.output import StderrLine
+from colcon_core.event.output import StdoutLine
+from colcon_core.subprocess import run as subprocess_run
+
+
+async def run_captured(
+    context, cmd, *, log_path: Path, buffer: bool = True,
+    **other_popen_kwargs
+):
+    """
+    Run the command and post its output as one block after it finished.
+
+    Unlike `colcon_core.task.run()` the output of commands running
+    concurrently for the same package is not interleaved. The output is also
+    written to `log_path`.
+
+    :param cmd: The command and its arguments
+    :param log_path: The file to write stdout and stderr to
+    :param buffer: False to post the output while the command is running
+    :returns: the result of the completed process
+    :rtype: subprocess.CompletedProcess
+    """
+    lines = []
+
+    def stdout_callback(line):
+        lines.append(StdoutLine(line))
+        if not buffer:
+            context.put_event_into_queue(lines[-1])
+
+    def stderr_callback(line):
+        lines.append(StderrLine(line))
+        if not buffer:
+            context.put_event_into_queue(lines[-1])
+
+    cwd = other_popen_kwargs.get('cwd', None)
+    env = other_popen_kwargs.get('env', None)
+
+    context.put_event_into_queue(Command(cmd, cwd=cwd, env=env))
+    completed = await subprocess_run(
+        cmd, stdout_callback, stderr_callback, use_pty=False,
+        **other_popen_kwargs)
+
+    log_path.parent.mkdir(parents=True, exist_ok=True)
+    with open(log_path, 'wb') as f:
+        for event in lines:
+            line = event.line
+            f.write(line if isinstance(line, bytes) else line.encode())
+    if buffer:
+        for event in lines:
+            context.put_event_into_queue(event)
+    context.put_event_into_queue(
+        CommandEnded(
+            cmd, cwd=cwd, env=env, returncode=completed.returncode))
+    return completed
+
+
+def get_dub_options(
+    args, *, build_type: bool = True, parallel: bool = True
+) -> List[str]:
+    """
+    Get the DUB options selected by the arguments of a package.
+
+    The options are `--dub-compiler`, `--dub-build-type` and
+    `--dub-parallel`, set from the command line or per package by the colcon
+    metadata keys `dub_compiler`, `dub_build_type` and `dub_parallel`.
+
+    :param args: The arguments of the package
+    :param build_type: False to omit the build type, e.g. for `dub test`
+    :param parallel: False to omit `--parallel`, which doesn't change the
+      build outputs
+    :returns: The options to pass before any `--`
+    """
+    options = []
+    compiler = getattr(args, 'dub_compiler', None)
+    if compiler:
+        options.append('--compiler=' + compiler)
+    build = getattr(args, 'dub_build_type', None)
+    if build_type and build:
+        options.append('--build=' + build)
+    if parallel and getattr(args, 'dub_parallel', False):
+        options.append('--parallel')
+    return options
@@ -2,23 +2,52 @@
 # Licensed under the Apache License, Version 2.0
 """Implement build task for DUB package."""
 
+import asyncio
+import functools
 import os
 from argparse import ArgumentParser
 from pathlib import Path
-from distutils.dir_util import copy_tree
-from shutil import copy2
-from typing import Dict, Optional
+from typing import Dict, List, Optional
 
 from colcon_dub.dub import DUB_EXECUTABLE
+from colcon_dub.dub import DubConfiguration
 from colcon_dub.dub import DubPackage
 from colcon_dub.dub import DUB_PACKAGE_PATH_ENV
+from colcon_dub.dub import find_packages
+from colcon_dub.dub.artifact_cache import ARTIFACT_CACHE_ENVIRONMENT_VARIABLE
+from colcon_dub.dub.artifact_cache import ArtifactCache
+from colcon_dub.dub.artifact_cache import DEFAULT_CACHE_SIZE
+from colcon_dub.dub.artifact_cache import get_output_files
+from colcon_dub.dub.artifact_cache import parse_size
+from colcon_dub.dub.batch import BatchMember
+from colcon_dub.dub.batch import build_in_batch
+from colcon_dub.dub.command_environment import get_cached_command_environment
+from colcon_dub.dub.fetch import prefetch_dependencies
+from colcon_dub.dub.fingerprint import combine
+from colcon_dub.dub.fingerprint import get_components
+from colcon_dub.dub.fingerprint import read_selections
+from colcon_dub.dub.fingerprint import SourceHashes
+from colcon_dub.dub.fingerprint import write_fingerprint
+from colcon_dub.dub.install import collect_files
+from colcon_dub.dub.install import get_install_filter
+from colcon_dub.dub.install import InstallManifest
+from colcon_dub.dub.install import sync_files
+from colcon_dub.dub.isolation import mirror_package
+from colcon_dub.dub.isolation import remove_mirror
+from colcon_dub.dub.testing import BUILD_ONLY_ENV
+from colcon_dub.dub.testing import find_test_binary
+from colcon_dub.dub.testing import get_test_binary_fingerprints
+from colcon_dub.dub.testing import get_test_configurations
+from colcon_dub.dub.testing import store_test_binary
+from colcon_dub.dub.testing import write_test_main
+from colcon_dub.dub.timing import PhaseTimer
+from colcon_dub.task.dub import get_dub_options
+from colcon_dub.task.dub import run_captured
 
 from colcon_core.logging import colcon_logger
 from colcon_core.task import TaskExtensionPoint
 from colcon_core.task import run
-from colcon_core.task import create_file
 from colcon_core.plugin_system import satisfies_version
-from colcon_core.shell import get_command_environment
 from colcon_core.environment import create_environment_scripts
 
 logger = colcon_logger.getChild(__name__)
@@ -30,6 +59,8 @@ class DubBuildTask(TaskExtensionPoint):
     def __init__(self):
         super().__init__()
         satisfies_version(TaskExtensionPoint.EXTENSION_POINT_VERSION, '^1.0')
+        # The components of the fingerprints of the configurations
+        self._components = None
 
     def add_arguments(self, *, parser: ArgumentParser):  # noqa: D102
         parser.add_argument(
@@ -38,6 +69,111 @@ class DubBuildTask(TaskExtensionPoint):
             help='Pass arguments to DUB projects. '
             'Arguments matching other options must be prefixed by a space,\n'
             'e.g. --dub-args " --help"')
+        parser.add_argument(
+            '--dub-compiler',
+            metavar='NAME',
+            help='The D compiler DUB builds with, e.g. dmd, ldc2 or gdc '
+            '(default: $DC or the first compiler found by DUB)')
+        parser.add_argument(
+            '--dub-build-type',
+            metavar='NAME',
+            help='The DUB build type, e.g. debug, release or a build type '
+            'of the package recipe (default: debug)')
+        parser.add_argument(
+            '--dub-parallel',
+            action='store_true',
+            help='Let DUB compile the modules of a package in parallel')
+        parser.add_argument(
+            '--dub-force-build',
+            action='store_true',
+            help='Invoke dub build even if neither the package nor its '
+            'dependencies changed since the last build')
+        parser.add_argument(
+            '--dub-parallel-configurations',
+            action='store_true',
+            help='Build the configurations of a DUB package concurrently. '
+            'The first configuration is built alone to resolve and build '
+            'the dependencies. The output of each other configuration is '
+            'shown after it finished')
+        parser.add_argument(
+            '--dub-configuration-jobs',
+            type=int, metavar='N',
+            help='The maximum number of configurations of a package built '
+            'concurrently (default: number of CPU cores)')
+        parser.add_argument(
+            '--dub-prefetch',
+            action='store_true',
+            help='Fetch the registry dependencies of all DUB packages once '
+            'before building them and build without querying the registry')
+        parser.add_argument(
+            '--dub-registry-mirror',
+            metavar='DIR',
+            help='A local directory of DUB package archives used by '
+            '--dub-prefetch instead of the default registries')
+        parser.add_argument(
+            '--dub-install-mode',
+            choices=('copy', 'hardlink', 'reflink'), default='copy',
+            help='Install files by copying them, as hardlinks or as reflinks '
+            '(copy-on-write clones). Hardlinks and reflinks fall back to '
+            'copying if the file system does not support them. '
+            '--symlink-install takes precedence (default: copy)')
+        parser.add_argument(
+            '--dub-artifact-cache',
+            metavar='DIR',
+            default=os.environ.get(ARTIFACT_CACHE_ENVIRONMENT_VARIABLE.name),
+            help='A directory shared between workspaces to store the build '
+            'outputs of configurations in, keyed by their fingerprint, and '
+            'to restore them from instead of compiling (default: '
+            '${ARTIFACT_CACHE_ENVIRONMENT_VARIABLE.name})'.format_map(
+                globals()))
+        parser.add_argument(
+            '--dub-artifact-cache-size',
+            metavar='SIZE', type=parse_size, default=DEFAULT_CACHE_SIZE,
+            help='The maximum size of the artifact cache, e.g. 512M or 5G. '
+            'The least recently used outputs are removed beyond it '
+            '(default: 5G)')
+        parser.add_argument(
+            '--dub-batch-build',
+            action='store_true',
+            help='Build the library configurations of DUB packages which '
+            'are ready at the same time with a single invocation of DUB. '
+            'Packages are still installed one by one')
+        parser.add_argument(
+            '--dub-batch-window',
+            type=float, metavar='SECONDS', default=0.5,
+            help='The time a batch waits for more packages to become ready '
+            '(default: 0.5)')
+        parser.add_argument(
+            '--dub-isolated-build',
+            action='store_true',
+            help='Invoke DUB in a mirror of the package directory made of '
+            'symlinks in the build base, so the .dub cache, build outputs '
+            'and local-packages.json are not written to the source '
+            'directory')
+        parser.add_argument(
+            '--dub-build-tests',
+            action='store_true',
+            help='Also build the unittest executables of the configurations '
+            'whose name starts with "unittest", so colcon test runs them '
+            'without invoking the compiler')
+        parser.add_argument(
+            '--dub-install-exclude',
+            nargs='*', metavar='PATTERN',
+            help='Additional patterns of files in the package directory '
+            'which are not installed to lib/dub/<package>, like the '
+            'installExclude field of dub.json')
+        parser.add_argument(
+            '--dub-install-include',
+            nargs='*', metavar='PATTERN',
+            help='Patterns of files in the package directory which are '
+            'installed even if they are excluded, like the installInclude '
+            'field of dub.json')
+        parser.add_argument(
+            '--dub-timing-report',
+            metavar='FILE',
+            help='Append the duration of each phase and configuration of '
+            'every DUB package to a CSV file. The timings of each package '
+            'are always written to <build_base>/colcon_dub/timings_build.json')
 
     async def build(
         self,
@@ -51,116 +187,460 @@ class DubBuildTask(TaskExtensionPoint):
             "Building DUB package in '{args.path}'".format_map(
                 locals()))
 
+        self._timer = PhaseTimer(pkg.name, 'build')
+        try:
+            return await self._build_package(
+                additional_hooks, skip_hook_creation)
+        finally:
+            self._timer.write_json(
+                Path(args.build_base) / 'colcon_dub' / 'timings_build.json')
+            if args.dub_timing_report:
+                self._timer.append_csv(Path(args.dub_timing_report))
+
+    async def _build_package(
+        self, additional_hooks, skip_hook_creation
+    ) -> Optional[int]:
+        pkg = self.context.pkg
+        args = self.context.args  # BuildPackageArguments
+
         try:
-            env = await get_command_environment(
-                'build', args.build_base, self.context.dependencies)
+            with self._timer.phase('environment'):
+                env = await get_cached_command_environment(
+                    'build', args.build_base, self.context.dependencies)
         except RuntimeError as e:
             logger.error(str(e))
             return 1
 
-        dub_package = DubPackage(Path(args.path))
+        dub_package = DubPackage.load(Path(args.path))
+        if dub_package is None:
+            logger.error(
+                "Could not find a DUB package in '{args.path}'".format_map(
+                    locals()))
+            return 1
 
-        rc = await self._configure(dub_package, env)
+        with self._timer.phase('configure'):
+            # The directory DUB is invoked in
+            if args.dub_isolated_build:
+                self._dub_path = mirror_package(
+                    dub_package, Path(args.build_base))
+            else:
+                remove_mirror(Path(args.build_base))
+                self._dub_path = Path(args.path)
+            depends = self._find_dependencies(env)
+            rc = await self._configure(dub_package, depends)
         if rc:
             return rc
 
-        rc = await self._build(dub_package, env)
+        rc = await self._build(dub_package, env, depends)
         if rc:
             return rc
 
-        rc = await self._install(dub_package)
+        if args.dub_build_tests:
+            rc = await self._build_tests(dub_package, env, depends)
+            if rc:
+                return rc
+
+        with self._timer.phase('install') as record:
+            rc = await self._install(dub_package, record)
         if rc:
             return rc
 
+        self._record_fingerprint(dub_package)
+
         if not skip_hook_creation:
             create_environment_scripts(
                 pkg, args, additional_hooks=additional_hooks)
 
-    async def _configure(self, dub: DubPackage, env: Dict) -> Optional[int]:
+    def _find_dependencies(self, env: Dict) -> List[DubPackage]:
+        return find_packages(
+            env.get(DUB_PACKAGE_PATH_ENV, ''), self.context.dependencies,
+            self.context.dependencies)
+
+    async def _configure(
+        self, dub: DubPackage, depends: List[DubPackage]
+    ) -> Optional[int]:
         self.progress('configure')
 
         if DUB_EXECUTABLE is None:
             raise RuntimeError("Could not find 'dub' executable")
 
-        depends = []
-        if DUB_PACKAGE_PATH_ENV in env:
-            for dep in env[DUB_PACKAGE_PATH_ENV].split(':'):
-                dep_dub = DubPackage.load(Path(dep))
-                if dep_dub and dep_dub.name in self.context.dependencies:
-                    depends.append(dep_dub)
+        await dub.create_local_packages(depends, self._dub_path)
 
-        await dub.create_local_packages(depends)
-
-    async def _build(self, dub: DubPackage, env: Dict) -> Optional[int]:
+    async def _build(
+        self, dub: DubPackage, env: Dict, depends: List[DubPackage]
+    ) -> Optional[int]:
         self.progress('build')
         args = self.context.args  # BuildPackageArguments
 
+        with self._timer.phase('fingerprint'):
+            fingerprints = await self._get_fingerprints(dub, env, depends)
+
+        configs = []
         for config in dub.configurations:
-            cmd = [DUB_EXECUTABLE, 'build']
-            if config.name is not None:
-                cmd += ['-c', config.name]
-            cmd += ['--']
-            cmd += (self.context.args.dub_args or [])
+            if not args.dub_force_build and \
+                    self._is_up_to_date(dub, config, fingerprints[config]):
+                logger.info(
+                    "Skipping configuration '{config.name}' of "
+                    "'{dub.name}': cache hit".format_map(locals()))
+                self.progress('build (cache hit)')
+                with self._timer.phase('build', config.name) as record:
+                    record['cache_hit'] = True
+                continue
+            configs.append(config)
+
+        if args.dub_artifact_cache and not args.dub_force_build:
+            configs = [
+                config for config in configs
+                if not self._restore_configuration(
+                    dub, config, fingerprints[config])]
+
+        if configs and args.dub_prefetch:
+            self.progress('fetch')
+            with self._timer.phase('fetch') as record:
+                with self._timer.subprocess(record):
+                    rc = await prefetch_dependencies(
+                        self.context, dub, self._dub_path,
+                        self.context.dependencies, env,
+                        registry=args.dub_registry_mirror)
+            if rc:
+                return rc
+
+        if configs and args.dub_batch_build:
+            configs = await self._build_batched(
+                dub, configs, env, depends, fingerprints)
+
+        if not args.dub_parallel_configurations or len(configs) < 2:
+            for config in configs:
+                rc = await self._build_configuration(
+                    dub, config, env, fingerprints[config])
+                if rc:
+                    return rc
+            return
+
+        # The processes share `.dub`, `dub.selections.json` and the builds of
+        # the dependencies. The first configuration resolves the dependencies
+        # and builds them alone, so the others only read the shared state.
+        rc = await self._build_configuration(
+            dub, configs[0], env, fingerprints[configs[0]])
+        if rc:
+            return rc
+
+        # The remaining configurations are independent of each other, so
+        # they can be built at the same time
+        jobs = args.dub_configuration_jobs or os.cpu_count() or 1
+        semaphore = asyncio.Semaphore(jobs)
+
+        async def build_configuration(config):
+            async with semaphore:
+                return await self._build_configuration(
+                    dub, config, env, fingerprints[config], capture=True)
+
+        rcs = await asyncio.gather(*[
+            build_configuration(config) for config in configs[1:]])
+        for rc in rcs:
+            if rc:
+                return rc
+
+    async def _build_configuration(
+        self, dub: DubPackage, config: DubConfiguration, env: Dict,
+        fingerprint: str, *, capture: bool = False
+    ) -> Optional[int]:
+        args = self.context.args  # BuildPackageArguments
+
+        fingerprint_path = _fingerprint_path(args, config)
+        if fingerprint_path.exists():
+            fingerprint_path.unlink()
+
+        cmd = [DUB_EXECUTABLE, 'build']
+        if config.name is not None:
+            cmd += ['-c', config.name]
+        cmd += self._get_build_args()
+
+        with self._timer.phase('build', config.name) as record, \
+                self._timer.subprocess(record):
+            record['cache_hit'] = False
+            if capture:
+                log_path = Path(args.build_base) / 'colcon_dub' / 'logs' / \
+                    '{name}.log'.format(name=config.name or 'default')
+                completed = await run_captured(
+                    self.context, cmd, log_path=log_path,
+                    cwd=str(self._dub_path), env=env)
+            else:
+                completed = await run(
+                    self.context, cmd, cwd=str(self._dub_path), env=env)
+        if completed.returncode:
+            return completed.returncode
+
+        self._record_configuration(config, fingerprint)
+
+    def _get_build_args(self) -> List[str]:
+        args = self.context.args  # BuildPackageArguments
+        build_args = []
+        if args.dub_prefetch:
+            # Dependencies were fetched already
+            build_args += ['--skip-registry=all']
+        # Arguments after `--` are only passed to the program by `dub run`,
+        # so the options of DUB must precede it
+        build_args += get_dub_options(args)
+        build_args += (args.dub_args or [])
+        return build_args
+
+    def _record_configuration(
+        self, config: DubConfiguration, fingerprint: str
+    ):
+        """Record the fingerprint and cache the outputs of a build."""
+        args = self.context.args  # BuildPackageArguments
+        # The first build writes dub.selections.json, which must not
+        # invalidate it. The fingerprint covers the versions selected by it.
+        selections = read_selections(self._dub_path)
+        if self._components is not None and \
+                selections != self._components['selections']:
+            fingerprint = combine(dict(
+                self._components, selections=selections,
+                configuration=config.name))
+        fingerprint_path = _fingerprint_path(args, config)
+        fingerprint_path.parent.mkdir(parents=True, exist_ok=True)
+        fingerprint_path.write_text(fingerprint)
+
+        if args.dub_artifact_cache:
+            files = get_output_files(self._dub_path, config)
+            if files:
+                self._artifact_cache().store(
+                    fingerprint, self._dub_path, files)
+
+    async def _build_batched(
+        self, dub: DubPackage, configs: List[DubConfiguration], env: Dict,
+        depends: List[DubPackage], fingerprints: Dict[DubConfiguration, str]
+    ) -> List[DubConfiguration]:
+        """
+        Build the library configurations together with other packages.
+
+        :returns: The configurations which still have to be built
+        """
+        args = self.context.args  # BuildPackageArguments
+        libraries = [c for c in configs if not c.is_executable()]
+        if not libraries:
+            return configs
+        for config in libraries:
+            fingerprint_path = _fingerprint_path(args, config)
+            if fingerprint_path.exists():
+                fingerprint_path.unlink()
+
+        build_args = self._get_build_args()
+        member = BatchMember(
+            dub, self._dub_path, [c.name for c in libraries], depends)
+        with self._timer.phase('batch') as record, \
+                self._timer.subprocess(record):
+            record['cache_hit'] = False
+            await build_in_batch(
+                self.context,
+                (env.get('DC'), env.get('DFLAGS'), tuple(build_args)),
+                member, env,
+                # Shared by all packages, next to their build directories
+                path=Path(args.build_base).parent / 'colcon_dub_batch',
+                dub_args=build_args, window=args.dub_batch_window)
+        if not member.built:
+            return configs
+
+        for config in libraries:
+            self._record_configuration(config, fingerprints[config])
+        return [c for c in configs if c.is_executable()]
+
+    def _restore_configuration(
+        self, dub: DubPackage, config: DubConfiguration, fingerprint: str
+    ) -> bool:
+        args = self.context.args  # BuildPackageArguments
+        with self._timer.phase('restore', config.name) as record:
+            files = self._artifact_cache().restore(
+                fingerprint, self._dub_path)
+            record['cache_hit'] = files is not None
+        if files is None:
+            return False
+        logger.info(
+            "Restored configuration '{config.name}' of '{dub.name}' from "
+            'the artifact cache'.format_map(locals()))
+        self.progress('build (artifact cache hit)')
+        fingerprint_path = _fingerprint_path(args, config)
+        fingerprint_path.parent.mkdir(parents=True, exist_ok=True)
+        fingerprint_path.write_text(fingerprint)
+        return True
+
+    def _artifact_cache(self) -> ArtifactCache:
+        args = self.context.args  # BuildPackageArguments
+        return ArtifactCache(
+            Path(args.dub_artifact_cache), args.dub_artifact_cache_size)
+
+    async def _build_tests(
+        self, dub: DubPackage, env: Dict, depends: List[DubPackage]
+    ) -> Optional[int]:
+        self.progress('build tests')
+        args = self.context.args  # BuildPackageArguments
+
+        configs = [c for c in get_test_configurations(dub) if c is not None]
+        if not configs:
+            logger.warning(
+                "'{dub.name}' has no configuration starting with 'unittest' "
+                'to build the tests of'.format_map(locals()))
+            return
+
+        binaries_path = Path(args.build_base) / 'colcon_dub' / \
+            'test_binaries'
+        fingerprints = await get_test_binary_fingerprints(
+            dub, env, depends, configs, SourceHashes(
+                Path(args.build_base) / 'colcon_dub' / 'source_hashes.json'),
+            get_dub_options(args, build_type=False, parallel=False),
+            self._dub_path)
+        for config in configs:
+            if not args.dub_force_build and find_test_binary(
+                    binaries_path, dub, config, fingerprints[config]):
+                with self._timer.phase('build_tests', config) as record:
+                    record['cache_hit'] = True
+                continue
 
-            completed = await run(self.context, cmd, cwd=args.path, env=env)
+            # Only dub test generates the test runner. The main file makes
+            # the executable exit before running the unittests.
+            object_path = self._dub_path / dub.test_object_path(
+                next(c for c in dub.configurations if c.name == config))
+            if object_path.exists():
+                object_path.unlink()
+            main_file = write_test_main(
+                Path(args.build_base) / 'colcon_dub')
+            cmd = [
+                DUB_EXECUTABLE, 'test', '-c', config,
+                '--main-file={main_file}'.format_map(locals())]
+            if args.dub_prefetch:
+                cmd += ['--skip-registry=all']
+            cmd += get_dub_options(args, build_type=False)
+
+            with self._timer.phase('build_tests', config) as record, \
+                    self._timer.subprocess(record):
+                record['cache_hit'] = False
+                completed = await run(
+                    self.context, cmd, cwd=str(self._dub_path),
+                    env=dict(env, **{BUILD_ONLY_ENV: '1'}))
             if completed.returncode:
                 return completed.returncode
+            if not store_test_binary(
+                    binaries_path, dub, config, fingerprints[config],
+                    self._dub_path):
+                logger.warning(
+                    "dub test did not produce the unittest executable of "
+                    "'{config}', colcon test will build it again".format_map(
+                        locals()))
+
+    async def _get_fingerprints(
+        self, dub: DubPackage, env: Dict, depends: List[DubPackage]
+    ) -> Dict[DubConfiguration, str]:
+        args = self.context.args  # BuildPackageArguments
+        # Compiling in parallel doesn't change the outputs
+        dub_args = get_dub_options(args, parallel=False) + \
+            (args.dub_args or [])
+
+        components = await get_components(
+            dub, env, depends, dub_args, SourceHashes(
+                Path(args.build_base) / 'colcon_dub' / 'source_hashes.json'),
+            self._dub_path)
+        self._components = dict(components)
+        fingerprints = {}
+        for config in dub.configurations:
+            components['configuration'] = config.name
+            fingerprints[config] = combine(components)
+        return fingerprints
 
-    async def _install(self, dub: DubPackage) -> Optional[int]:
+    def _is_up_to_date(
+        self, dub: DubPackage, config: DubConfiguration, fingerprint: str
+    ) -> bool:
+        args = self.context.args  # BuildPackageArguments
+        try:
+            recorded = _fingerprint_path(args, config).read_text()
+        except OSError:
+            return False
+        if recorded != fingerprint:
+            return False
+        # The output must still be there to be installed
+        return not config.is_executable() or \
+            (self._dub_path / config.object_path()).exists()
+
+    def _record_fingerprint(self, dub: DubPackage):
+        """Publish the fingerprint of the package for its dependents."""
+        args = self.context.args  # BuildPackageArguments
+        fingerprints = []
+        for config in dub.configurations:
+            try:
+                fingerprints.append(
+                    _fingerprint_path(args, config).read_text())
+            except OSError:
+                return
+        write_fingerprint(
+            Path(args.install_base) / 'lib' / 'dub' / self.context.pkg.name,
+            combine(fingerprints))
+
+    async def _install(
+        self, dub: DubPackage, record: Dict
+    ) -> Optional[int]:
         self.progress('install')
         args = self.context.args  # BuildPackageArguments
 
-        # We now install to <install_base>/lib/dub/<package>
-        src_dir = Path(dub.path)
-
-        # Ignore git files
-        files = [
-            f for f in os.listdir(src_dir)
-            if not f.startswith('.git')
-            and f != '.' and f != '..'
-        ]
-
-        # install DUB
-        for f in files:
-            dst_f = Path(f).parts[-1]
-            _copy_path(
-                args, f,
-                'lib/dub/{self.context.pkg.name}/{dst_f}'.format_map(locals()))
+        # We now install to <install_base>/lib/dub/<package> without git
+        # files, DUB caches and build outputs
+        install = collect_files(
+            Path(dub.path),
+            'lib/dub/{self.context.pkg.name}'.format_map(locals()),
+            get_install_filter(
+                dub, excludes=args.dub_install_exclude or [],
+                includes=args.dub_install_include or []))
 
         # install builds
         for c in dub.configurations:
             if not c.is_executable():
                 continue
             obj_path = c.object_path()
-            _copy_path(
-                args, obj_path,
-                'lib/{self.context.pkg.name}/{obj_path}'.format_map(locals()))
+            if not _collect_path(
+                    install, self._dub_path, obj_path,
+                    'lib/{self.context.pkg.name}/{obj_path}'.format_map(
+                        locals())):
+                return 1
 
         # install files
         for dst, files in dub.install_files.items():
             for f in files:
                 dst_f = Path(f).parts[-1]
-                _copy_path(
-                    args, f,
-                    '{dst}/{dst_f}'.format_map(locals()))
+                if not _collect_path(
+                        install, Path(args.path), f,
+                        '{dst}/{dst_f}'.format_map(locals())):
+                    return 1
 
         # create files
         for dst, files in dub.create_files.items():
             for f in files:
-                create_file(args, '{dst}/{f}'.format_map(locals()))
-
-
-def _copy_path(args, src_path, dst_path):
-    dst_path = Path(args.install_base) / dst_path
-    src_path = Path(args.path) / src_path
-    logger.info("'{src_path}' -> '{dst_path}'".format_map(locals()))
-    try:
-        os.makedirs(dst_path.parent, exist_ok=True)
-    except RuntimeError as e:
-        logger.error(str(e))
-        return
-
-    if src_path.is_file():
-        copy2(src_path, dst_path)
-    else:
-        copy_tree(str(src_path), str(dst_path))
+                install['{dst}/{f}'.format_map(locals())] = None
+
+        manifest = InstallManifest(
+            Path(args.build_base) / 'colcon_dub' / 'install_manifest.json')
+        mode = 'symlink' if args.symlink_install else args.dub_install_mode
+        # Copy on a worker thread to keep the event loop responsive for other
+        # packages
+        copied, copied_bytes = await asyncio.get_event_loop().run_in_executor(
+            None, functools.partial(
+                sync_files, install, Path(args.install_base), manifest,
+                mode=mode))
+        record['files_copied'] = copied
+        record['bytes_copied'] = copied_bytes
+        logger.info(
+            'Installed {copied} of {n} files'.format(
+                copied=copied, n=len(install)))
+
+
+def _fingerprint_path(args, config: DubConfiguration) -> Path:
+    name = config.name or 'default'
+    return Path(args.build_base) / 'colcon_dub' / 'fingerprints' / name
+
+
+def _collect_path(install, root: Path, src_path, dst_path) -> bool:
+    src_path = root / src_path
+    files = collect_files(src_path, Path(dst_path).as_posix())
+    if files is None:
+        logger.error("'{src_path}' does not exist".format_map(locals()))
+        return False
+    install.update(files)
+    return True
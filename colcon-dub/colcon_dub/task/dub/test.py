@@ -2,18 +2,36 @@
 # Licensed under the Apache License, Version 2.0
 """Implement test task for DUB package."""
 
+import asyncio
+import os
 from argparse import ArgumentParser
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Dict, Optional, Tuple
 
 from colcon_dub.dub import DUB_EXECUTABLE
 from colcon_dub.dub import DubPackage
+from colcon_dub.dub import DUB_PACKAGE_PATH_ENV
+from colcon_dub.dub import find_packages
+from colcon_dub.dub.command_environment import get_cached_command_environment
+from colcon_dub.dub.fingerprint import combine
+from colcon_dub.dub.fingerprint import get_components
+from colcon_dub.dub.fingerprint import SourceHashes
+from colcon_dub.dub.isolation import get_isolated_path
+from colcon_dub.dub.testing import CachedTestResult
+from colcon_dub.dub.testing import find_modules
+from colcon_dub.dub.testing import find_test_binary
+from colcon_dub.dub.testing import get_test_binary_fingerprints
+from colcon_dub.dub.testing import get_test_configurations
+from colcon_dub.dub.testing import shard_filters
+from colcon_dub.dub.testing import write_junit
+from colcon_dub.dub.timing import PhaseTimer
+from colcon_dub.task.dub import get_dub_options
+from colcon_dub.task.dub import run_captured
 
+from colcon_core.event.output import StdoutLine
 from colcon_core.logging import colcon_logger
 from colcon_core.task import TaskExtensionPoint
-from colcon_core.task import run
 from colcon_core.plugin_system import satisfies_version
-from colcon_core.shell import get_command_environment
 
 logger = colcon_logger.getChild(__name__)
 
@@ -29,9 +47,48 @@ class DubTestTask(TaskExtensionPoint):
         parser.add_argument(
             '--dub-args',
             nargs='*', metavar='*', type=str.lstrip,
-            help='Pass arguments to DUB projects. '
+            help='Pass arguments to the test runner of DUB projects. '
             'Arguments matching other options must be prefixed by a space,\n'
             'e.g. --dub-args " --help"')
+        parser.add_argument(
+            '--dub-compiler',
+            metavar='NAME',
+            help='The D compiler DUB builds the tests with, e.g. dmd, ldc2 '
+            'or gdc (default: $DC or the first compiler found by DUB)')
+        parser.add_argument(
+            '--dub-parallel',
+            action='store_true',
+            help='Let DUB compile the modules of a package in parallel')
+        parser.add_argument(
+            '--dub-test-configurations',
+            nargs='*', metavar='NAME',
+            help='The configurations to test. The first one is tested alone '
+            'to resolve the dependencies, the others concurrently (default: '
+            'the configurations whose name starts with "unittest", or the '
+            'configuration chosen by dub test if there is none)')
+        parser.add_argument(
+            '--dub-test-shards',
+            type=int, metavar='N', default=1,
+            help='Split the unittests of each configuration by module into '
+            'N processes. The shards are selected with "-i REGEX", which '
+            'requires a test runner like silly')
+        parser.add_argument(
+            '--dub-test-jobs',
+            type=int, metavar='N',
+            help='The maximum number of test processes of a package running '
+            'concurrently (default: number of CPU cores)')
+        parser.add_argument(
+            '--dub-test-force',
+            action='store_true',
+            help='Run the tests even if neither the package nor its '
+            'dependencies changed since the last run, instead of replaying '
+            'the cached result')
+        parser.add_argument(
+            '--dub-timing-report',
+            metavar='FILE',
+            help='Append the duration of each phase of every DUB package to '
+            'a CSV file. The timings of each package are always written to '
+            '<build_base>/colcon_dub/timings_test.json')
 
     async def test(
         self, *, additional_hooks=None) -> Optional[int]:  # noqa D102
@@ -42,14 +99,32 @@ class DubTestTask(TaskExtensionPoint):
             "Testing DUB package in '{args.path}'".format_map(
                 locals()))
 
+        self._timer = PhaseTimer(pkg.name, 'test')
         try:
-            env = await get_command_environment(
-                'test', args.build_base, self.context.dependencies)
+            return await self._test_package()
+        finally:
+            self._timer.write_json(
+                Path(args.build_base) / 'colcon_dub' / 'timings_test.json')
+            if args.dub_timing_report:
+                self._timer.append_csv(Path(args.dub_timing_report))
+
+    async def _test_package(self) -> Optional[int]:
+        args = self.context.args  # TestPackageArguments
+
+        try:
+            with self._timer.phase('environment'):
+                env = await get_cached_command_environment(
+                    'test', args.build_base, self.context.dependencies)
         except RuntimeError as e:
             logger.error(str(e))
             return 1
 
-        dub_package = DubPackage(Path(args.path))
+        dub_package = DubPackage.load(Path(args.path))
+        if dub_package is None:
+            logger.error(
+                "Could not find a DUB package in '{args.path}'".format_map(
+                    locals()))
+            return 1
 
         rc = await self._test(dub_package, env)
         if rc:
@@ -63,10 +138,183 @@ class DubTestTask(TaskExtensionPoint):
 
         args = self.context.args  # TestPackageArguments
 
-        cmd = [DUB_EXECUTABLE, 'test']
-        cmd += ['--']
-        cmd += (self.context.args.dub_args or [])
+        configs = get_test_configurations(dub, args.dub_test_configurations)
+        filters = [None]
+        if args.dub_test_shards > 1:
+            filters = shard_filters(find_modules(dub), args.dub_test_shards)
+            filters = filters or [None]
+
+        # colcon test passes the package itself as a dependency, but the
+        # fingerprints of the build task don't contain it
+        names = [
+            name for name in self.context.dependencies
+            if name != self.context.pkg.name]
+        depends = find_packages(
+            env.get(DUB_PACKAGE_PATH_ENV, ''), names,
+            self.context.dependencies)
+        # Test in the mirror of the package if it was built isolated
+        self._dub_path = get_isolated_path(Path(args.build_base)) or \
+            Path(args.path)
+
+        source_hashes = SourceHashes(
+            Path(args.build_base) / 'colcon_dub' / 'source_hashes.json')
+        with self._timer.phase('fingerprint'):
+            components = await get_components(
+                dub, env, depends,
+                get_dub_options(args, parallel=False) + (args.dub_args or []),
+                source_hashes, self._dub_path)
+            components['test_configurations'] = configs
+            components['test_filters'] = filters
+            fingerprint = combine(components)
+        cache = CachedTestResult(
+            Path(args.build_base) / 'colcon_dub' / 'test_result_cache.json')
+        if not args.dub_test_force and cache.fingerprint == fingerprint:
+            return self._replay(dub, cache)
+
+        # Remove the results of configurations and shards not run anymore
+        # colcon already appends the package name to --test-result-base
+        if getattr(args, 'test_result_base', None):
+            self._test_results_path = Path(args.test_result_base)
+        else:
+            self._test_results_path = Path(args.build_base) / \
+                'test_results' / self.context.pkg.name
+        for path in self._test_results_path.glob('dub-*.xml'):
+            path.unlink()
+
+        # Run the unittest executables built by the build task if they are
+        # up to date
+        binaries = {}
+        named_configs = [c for c in configs if c is not None]
+        if named_configs:
+            binary_fingerprints = await get_test_binary_fingerprints(
+                dub, env, depends, named_configs, source_hashes,
+                get_dub_options(args, build_type=False, parallel=False),
+                self._dub_path)
+            for config in named_configs:
+                binaries[config] = find_test_binary(
+                    Path(args.build_base) / 'colcon_dub' / 'test_binaries',
+                    dub, config, binary_fingerprints[config])
+
+        # Show the output of concurrent processes one after another
+        capture = len(configs) * len(filters) > 1
+        semaphore = asyncio.Semaphore(
+            args.dub_test_jobs or os.cpu_count() or 1)
+
+        async def test_configuration(config):
+            # The first shard builds the test executable, which the others
+            # run directly
+            binary = binaries.get(config)
+            object_path = None
+            if binary is None and len(filters) > 1:
+                object_path = self._get_test_object_path(dub, config)
+                if object_path is not None and object_path.exists():
+                    # Don't run a stale executable if the build fails
+                    object_path.unlink()
+            results = [await self._run_tests(
+                config, 0, filters[0], env, semaphore, binary,
+                capture=capture)]
+            if object_path is not None and object_path.is_file():
+                binary = object_path
+            if binary is None:
+                # The executable is unknown, so the others invoke dub test
+                # one after another instead of building it concurrently
+                for i, f in enumerate(filters):
+                    if i > 0:
+                        results.append(await self._run_tests(
+                            config, i, f, env, semaphore, None,
+                            capture=capture))
+                return results
+            results += await asyncio.gather(*(
+                self._run_tests(
+                    config, i, f, env, semaphore, binary, capture=capture)
+                for i, f in enumerate(filters) if i > 0))
+            return results
+
+        # The first dub test resolves the dependencies and writes
+        # dub.selections.json, which concurrent invocations would race on
+        results = [await test_configuration(configs[0])]
+        results += await asyncio.gather(*(
+            test_configuration(config) for config in configs[1:]))
+        rcs = []
+        for config, config_results in zip(configs, results):
+            rc = next((rc for rc, _ in config_results if rc), None)
+            name = config or 'default'
+            result = 'failed' if rc else 'passed'
+            logger.info(
+                "Tests of configuration '{name}' of '{dub.name}' "
+                '{result}'.format_map(locals()))
+            rcs.append(rc)
+        rc = next((rc for rc in rcs if rc), None)
+
+        cache.save(fingerprint, rc, [
+            log_path for config_results in results
+            for _, log_path in config_results])
+        return rc
+
+    def _get_test_object_path(
+        self, dub: DubPackage, config: Optional[str]
+    ) -> Optional[Path]:
+        """Get the executable `dub test` builds for a configuration."""
+        for c in dub.configurations:
+            if config is not None and c.name == config:
+                return self._dub_path / dub.test_object_path(c)
+        # The configuration chosen by dub test isn't known
+        return None
+
+    def _replay(self, dub: DubPackage, cache: CachedTestResult):
+        logger.info(
+            "Skipping tests of '{dub.name}': cache hit, replaying the "
+            'result of the last run'.format_map(locals()))
+        self.progress('test (cache hit)')
+        with self._timer.phase('test') as record:
+            record['cache_hit'] = True
+        for line in cache.output.splitlines(keepends=True):
+            self.context.put_event_into_queue(StdoutLine(line))
+        return cache.returncode
+
+    async def _run_tests(
+        self, config: Optional[str], shard: int, test_filter: Optional[str],
+        env: Dict, semaphore: asyncio.Semaphore, binary: Optional[Path], *,
+        capture: bool
+    ) -> Tuple[Optional[int], Path]:
+        args = self.context.args  # TestPackageArguments
+
+        if binary is not None:
+            # Built by the build task, no need to invoke the compiler
+            cmd = [str(binary)]
+        else:
+            cmd = [DUB_EXECUTABLE, 'test']
+            if config is not None:
+                cmd += ['-c', config]
+            cmd += get_dub_options(args, build_type=False)
+            cmd += ['--']
+        cmd += (args.dub_args or [])
+        if test_filter is not None:
+            cmd += ['-i', test_filter]
+
+        name = config or 'default'
+        if test_filter is not None:
+            name += '-{shard}'.format_map(locals())
+        log_path = Path(args.build_base) / 'colcon_dub' / 'logs' / \
+            'test-{name}.log'.format_map(locals())
 
-        completed = await run(self.context, cmd, cwd=args.path, env=env)
+        async with semaphore:
+            with self._timer.phase(
+                'test', config,
+                shard if test_filter is not None else None
+            ) as record, self._timer.subprocess(record):
+                record['cache_hit'] = False
+                completed = await run_captured(
+                    self.context, cmd, log_path=log_path, buffer=capture,
+                    cwd=str(self._dub_path), env=env)
+        write_junit(
+            self._test_results_path / 'dub-{name}.xml'.format_map(locals()),
+            '{self.context.pkg.name}.{name}'.format_map(locals()),
+            log_path.read_text(errors='replace'), completed.returncode,
+            record['subprocess_seconds'])
         if completed.returncode:
-            return completed.returncode
+            logger.error(
+                "Tests of '{name}' failed with {completed.returncode}"
+                .format_map(locals()))
+            return completed.returncode, log_path
+        return None, log_path
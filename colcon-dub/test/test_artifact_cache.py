@@ -0,0 +1,91 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+
+import json
+import os
+from pathlib import Path
+
+from colcon_dub.dub import DubConfiguration
+from colcon_dub.dub.artifact_cache import ArtifactCache
+from colcon_dub.dub.artifact_cache import get_output_files
+from colcon_dub.dub.artifact_cache import parse_size
+import pytest
+
+
+def _build(root: Path, name: str, content: str):
+    (root / 'bin').mkdir(parents=True, exist_ok=True)
+    (root / 'bin' / name).write_text(content)
+    (root / 'bin' / (name + '.d')).write_text('source')
+    return get_output_files(root, DubConfiguration(
+        {'name': name, 'targetPath': 'bin'}))
+
+
+def test_artifact_cache_restore(tmp_path: Path):
+    """Check if stored outputs are restored into another directory."""
+    cache = ArtifactCache(tmp_path / 'cache')
+    files = _build(tmp_path / 'ws1', 'app', 'binary')
+    assert files == ['bin/app']
+
+    assert cache.restore('1234', tmp_path / 'ws2') is None
+    cache.store('1234', tmp_path / 'ws1', files)
+    assert cache.restore('1234', tmp_path / 'ws2') == files
+    assert (tmp_path / 'ws2' / 'bin' / 'app').read_text() == 'binary'
+
+
+def test_artifact_cache_evict(tmp_path: Path):
+    """Check if the least recently used entries are evicted."""
+    cache = ArtifactCache(tmp_path / 'cache', max_size=250)
+    for i, key in enumerate(('aa01', 'bb02', 'cc03')):
+        files = _build(tmp_path / key, key, 'x' * 100)
+        cache.store(key, tmp_path / key, files)
+        manifest = cache.path / key[:2] / key / 'manifest.json'
+        os.utime(manifest, (i, i))
+        if i == 1:
+            # Use the first entry, so the second one is evicted
+            assert cache.restore('aa01', tmp_path / 'out')
+            os.utime(cache.path / 'aa' / 'aa01' / 'manifest.json', (5, 5))
+
+    assert cache.restore('aa01', tmp_path / 'out') is not None
+    assert cache.restore('bb02', tmp_path / 'out') is None
+    assert cache.restore('cc03', tmp_path / 'out') is not None
+
+
+def test_parse_size():
+    """Check if sizes with units are parsed."""
+    assert parse_size('1024') == 1024
+    assert parse_size('512M') == 512 << 20
+    assert parse_size('1.5GiB') == 3 << 29
+    with pytest.raises(ValueError):
+        parse_size('many')
+
+
+def test_artifact_cache_size_index(tmp_path: Path, monkeypatch):
+    """Check if the entries are only scanned beyond the size limit."""
+    scans = []
+    evict = ArtifactCache.evict
+
+    def counting_evict(self):
+        scans.append(True)
+        evict(self)
+
+    monkeypatch.setattr(ArtifactCache, 'evict', counting_evict)
+    cache = ArtifactCache(tmp_path / 'cache', max_size=250)
+
+    # The missing index is created by a scan
+    cache.store('aa01', tmp_path / 'aa01', _build(
+        tmp_path / 'aa01', 'aa01', 'x' * 100))
+    assert len(scans) == 1
+    assert json.loads((cache.path / 'size.json').read_text()) == \
+        {'size': 100}
+
+    cache.store('bb02', tmp_path / 'bb02', _build(
+        tmp_path / 'bb02', 'bb02', 'x' * 100))
+    assert len(scans) == 1
+    assert json.loads((cache.path / 'size.json').read_text()) == \
+        {'size': 200}
+
+    cache.store('cc03', tmp_path / 'cc03', _build(
+        tmp_path / 'cc03', 'cc03', 'x' * 100))
+    assert len(scans) == 2
+    assert json.loads((cache.path / 'size.json').read_text()) == \
+        {'size': 200}
@@ -0,0 +1,146 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+
+import argparse
+import asyncio
+import json
+from pathlib import Path
+import subprocess
+
+from colcon_core.event.command import CommandEnded
+from colcon_core.event.output import StderrLine
+from colcon_core.event.output import StdoutLine
+from colcon_core.package_descriptor import PackageDescriptor
+from colcon_core.task import TaskContext
+from colcon_dub.dub import batch
+from colcon_dub.dub import DubPackage
+from colcon_dub.dub.batch import BatchMember
+from colcon_dub.dub.batch import build_in_batch
+from colcon_dub.dub.batch import create_batch_package
+from colcon_dub.dub.timing import PhaseTimer
+from colcon_dub.task.dub.build import DubBuildTask
+
+ENV = {'DC': 'colcon-dub-missing-compiler', 'PATH': ''}
+
+
+def _member(path: Path, name: str, configurations) -> BatchMember:
+    (path / name).mkdir(parents=True)
+    (path / name / 'dub.json').write_text(json.dumps({'name': name}))
+    return BatchMember(
+        DubPackage(path / name), path / name, configurations, [])
+
+
+def test_create_batch_package(tmp_path: Path):
+    """Check if each round builds one configuration of every member."""
+    members = [
+        _member(tmp_path, 'a', ['library', 'unittest']),
+        _member(tmp_path, 'b', [None]),
+    ]
+    batch_path = tmp_path / 'batch'
+    assert create_batch_package(batch_path, members) == 2
+
+    recipe = json.loads((batch_path / 'dub.json').read_text())
+    assert recipe['targetType'] == 'none'
+    round0, round1 = recipe['configurations']
+    assert sorted(round0['dependencies']) == ['a', 'b']
+    assert round0['subConfigurations'] == {'a': 'library'}
+    assert round1['dependencies'] == {'a': {'path': str(tmp_path / 'a')}}
+    assert round1['subConfigurations'] == {'a': 'unittest'}
+
+    # An unchanged recipe is not written again
+    mtime = (batch_path / 'dub.json').stat().st_mtime_ns
+    create_batch_package(batch_path, members)
+    assert (batch_path / 'dub.json').stat().st_mtime_ns == mtime
+
+
+def test_build_in_batch_alone(tmp_path: Path):
+    """Check if a package without company is left to build alone."""
+    member = _member(tmp_path, 'a', ['library'])
+    asyncio.run(build_in_batch(
+        None, 'key', member, {}, path=tmp_path / 'batch', dub_args=[],
+        window=0))
+    assert not member.built
+    assert not (tmp_path / 'batch').exists()
+
+
+def _create_task(tmp_path: Path, name: str):
+    pkg = tmp_path / 'src' / name
+    pkg.mkdir(parents=True)
+    (pkg / 'dub.json').write_text(json.dumps({
+        'name': name,
+        'configurations': [{'name': 'library', 'targetType': 'library'}],
+    }))
+    dub = DubPackage(pkg)
+    parser = argparse.ArgumentParser()
+    DubBuildTask().add_arguments(parser=parser)
+    args = parser.parse_args(
+        ['--dub-batch-build', '--dub-batch-window', '0.05'])
+    args.path = str(pkg)
+    args.build_base = str(tmp_path / 'build' / name)
+    args.install_base = str(tmp_path / 'install' / name)
+    args.symlink_install = False
+    args.dub_artifact_cache = None
+    desc = PackageDescriptor(pkg)
+    desc.name = name
+    task = DubBuildTask()
+    task.set_context(context=TaskContext(
+        pkg=desc, args=args, dependencies={}))
+    events = []
+    task.context.put_event_into_queue = events.append
+    task._timer = PhaseTimer(name, 'build')
+    task._dub_path = pkg
+    return task, dub, events
+
+
+def test_build_in_batch_members(tmp_path: Path, monkeypatch):
+    """Check if each member of a batch is built, installed and reported."""
+    names = ('a', 'b', 'c')
+    batch_paths = []
+
+    async def subprocess_run(
+        cmd, stdout_callback, stderr_callback, *, cwd, **kwargs
+    ):
+        batch_paths.append(Path(cwd))
+        recipe = json.loads((Path(cwd) / 'dub.json').read_text())
+        stdout_callback(b'Resolving dependencies\n')
+        for name, spec in recipe['configurations'][0][
+                'dependencies'].items():
+            stdout_callback('{name} ~master: building configuration '
+                            '"library"...\n'.format_map(locals()).encode())
+            (Path(spec['path']) / ('lib' + name + '.a')).write_text('')
+            stderr_callback('{name}.d: warning\n'.format_map(
+                locals()).encode())
+        return subprocess.CompletedProcess(cmd, 0)
+
+    monkeypatch.setattr(batch, 'DUB_EXECUTABLE', 'dub')
+    monkeypatch.setattr(batch, 'subprocess_run', subprocess_run)
+    tasks = [_create_task(tmp_path, name) for name in names]
+
+    async def build_all():
+        return await asyncio.gather(*(
+            task._build(dub, ENV, []) for task, dub, _ in tasks))
+
+    assert asyncio.run(build_all()) == [None, None, None]
+    # One batch built next to the build directories of the packages
+    assert len(batch_paths) == 1
+    assert batch_paths[0].parent == tmp_path / 'build' / 'colcon_dub_batch'
+
+    for (task, dub, events), name in zip(tasks, names):
+        assert (dub.path / ('lib' + name + '.a')).is_file()
+        assert (tmp_path / 'build' / name / 'colcon_dub' / 'fingerprints' /
+                'library').is_file()
+        asyncio.run(task._install(dub, {}))
+        assert (tmp_path / 'install' / name / 'lib' / 'dub' / name /
+                'dub.json').is_file()
+
+        lines = [
+            e.line.decode() for e in events
+            if isinstance(e, (StdoutLine, StderrLine))]
+        own = [
+            '{name} ~master: building configuration "library"...\n'.format_map(
+                locals()),
+            '{name}.d: warning\n'.format_map(locals())]
+        if name == names[0]:
+            own.insert(0, 'Resolving dependencies\n')
+        assert lines == own
+        assert any(isinstance(e, CommandEnded) for e in events)
@@ -0,0 +1,99 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from pathlib import Path
+
+from colcon_dub.dub import command_environment
+from colcon_dub.dub.command_environment import get_cached_command_environment
+from colcon_dub.dub.command_environment import get_environment_key
+
+
+def test_environment_key(tmp_path: Path):
+    """Check if the key changes with the dependencies and their hooks."""
+    hook = tmp_path / 'dep' / 'share' / 'dep' / 'package.sh'
+    hook.parent.mkdir(parents=True)
+    hook.write_text('')
+    dependencies = OrderedDict(dep=str(tmp_path / 'dep'))
+
+    key = get_environment_key(dependencies)
+    assert get_environment_key(dependencies) == key
+    assert get_environment_key(OrderedDict()) != key
+
+    st = hook.stat()
+    os.utime(hook, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+    assert get_environment_key(dependencies) != key
+
+
+def test_environment_persisted(tmp_path: Path):
+    """Check if the environment stored in the build base is reused."""
+    dependencies = OrderedDict(dep=str(tmp_path / 'dep'))
+    cache = tmp_path / 'build' / 'colcon_dub' / 'command_environment.json'
+    cache.parent.mkdir(parents=True)
+    cache.write_text(json.dumps({'environments': {
+        get_environment_key(dependencies): {'CACHED': '1'},
+    }}))
+
+    env = asyncio.run(get_cached_command_environment(
+        'build', str(tmp_path / 'build'), dependencies))
+    assert env == {'CACHED': '1'}
+
+
+def test_environment_without_working_directory(tmp_path: Path, monkeypatch):
+    """Check if PWD and OLDPWD are neither stored nor reused."""
+    dependencies = OrderedDict(dep=str(tmp_path / 'dep'))
+    key = get_environment_key(dependencies)
+    monkeypatch.setenv('PWD', str(tmp_path / 'elsewhere'))
+    monkeypatch.setenv('OLDPWD', str(tmp_path))
+    assert get_environment_key(dependencies) == key
+
+    cache = tmp_path / 'build' / 'colcon_dub' / 'command_environment.json'
+    cache.parent.mkdir(parents=True)
+    cache.write_text(json.dumps({'environments': {
+        key: {'CACHED': '1', 'PWD': '/old', 'OLDPWD': '/older'},
+    }}))
+    env = asyncio.run(get_cached_command_environment(
+        'build', str(tmp_path / 'build'), dependencies))
+    assert env == {'CACHED': '1'}
+
+
+def test_environment_of_build_and_test(tmp_path: Path, monkeypatch):
+    """Check if the environments of the build and the test task are kept."""
+    calls = []
+
+    async def get_command_environment(task_name, build_base, dependencies):
+        calls.append(task_name)
+        return {'TASK': task_name}
+
+    monkeypatch.setattr(
+        command_environment, 'get_command_environment',
+        get_command_environment)
+    monkeypatch.setattr(command_environment, '_environments', {})
+    build_base = str(tmp_path / 'build')
+    # colcon test passes the package itself as a dependency
+    build_dependencies = OrderedDict(dep=str(tmp_path / 'dep'))
+    test_dependencies = OrderedDict(
+        dep=str(tmp_path / 'dep'), pkg=str(tmp_path / 'pkg'))
+
+    for _ in range(2):
+        # A new invocation
+        monkeypatch.setattr(command_environment, '_environments', {})
+        assert asyncio.run(get_cached_command_environment(
+            'build', build_base, build_dependencies)) == {'TASK': 'build'}
+        monkeypatch.setattr(command_environment, '_environments', {})
+        assert asyncio.run(get_cached_command_environment(
+            'test', build_base, test_dependencies)) == {'TASK': 'test'}
+    assert calls == ['build', 'test']
+
+    # Only the last environments are kept
+    for i in range(command_environment.COMMAND_ENVIRONMENT_CACHE_SIZE):
+        asyncio.run(get_cached_command_environment(
+            'build', build_base, OrderedDict(other=str(i))))
+    cache = tmp_path / 'build' / 'colcon_dub' / 'command_environment.json'
+    environments = json.loads(cache.read_text())['environments']
+    assert len(environments) == \
+        command_environment.COMMAND_ENVIRONMENT_CACHE_SIZE
+    assert get_environment_key(build_dependencies) not in environments
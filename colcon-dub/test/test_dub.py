@@ -34,7 +34,7 @@ def test_dub_package_execute(bash: pytest_shell.shell.bash):
     """Check if the dub package was built by executing."""
     bash.cd(WORKSPACE_ROOT)
     assert bash.run_script_inline([
-        f'./{INSTALL}/lib/dub/{PKG}/{PKG}'
+        f'./{INSTALL}/lib/{PKG}/{PKG}'
     ]) == 'Hello, World!'
 
 
@@ -0,0 +1,65 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+
+import argparse
+from pathlib import Path
+
+from colcon_core.package_descriptor import PackageDescriptor
+from colcon_core.task import TaskContext
+from colcon_core.verb.build import BuildPackageArguments
+from colcon_dub.task.dub import get_dub_options
+from colcon_dub.task.dub.build import DubBuildTask
+
+
+def _get_package_args(tmp_path: Path, argv, metadata):
+    parser = argparse.ArgumentParser()
+    DubBuildTask().add_arguments(parser=parser)
+    args = parser.parse_args(argv)
+    args.build_base = str(tmp_path / 'build')
+    args.install_base = str(tmp_path / 'install')
+    args.merge_install = False
+    args.symlink_install = False
+    args.test_result_base = None
+    pkg = PackageDescriptor(tmp_path / 'src' / 'pkg')
+    pkg.name = 'pkg'
+    pkg.metadata.update(metadata)
+    destinations = [
+        action.dest for action in parser._actions if action.dest != 'help']
+    return pkg, BuildPackageArguments(
+        pkg, args, additional_destinations=destinations)
+
+
+def test_get_dub_options_metadata(tmp_path: Path):
+    """Check if the package metadata overrides the command line options."""
+    _, args = _get_package_args(
+        tmp_path, ['--dub-compiler', 'dmd', '--dub-build-type', 'debug'], {})
+    assert get_dub_options(args) == ['--compiler=dmd', '--build=debug']
+
+    _, args = _get_package_args(
+        tmp_path, ['--dub-compiler', 'dmd', '--dub-build-type', 'debug'], {
+            'dub_build_type': 'release',
+            'dub_parallel': True,
+        })
+    assert get_dub_options(args) == [
+        '--compiler=dmd', '--build=release', '--parallel']
+    assert get_dub_options(args, build_type=False, parallel=False) == [
+        '--compiler=dmd']
+
+    # Packages without the options, e.g. built by other tasks
+    assert get_dub_options(argparse.Namespace()) == []
+
+
+def test_get_build_args_order(tmp_path: Path):
+    """Check if the options of DUB precede the arguments of the user."""
+    pkg, args = _get_package_args(tmp_path, [
+        '--dub-prefetch', '--dub-build-type', 'debug',
+        '--dub-args', ' --combined', 'arg',
+    ], {'dub_compiler': 'ldc2', 'dub_parallel': True})
+    task = DubBuildTask()
+    task.set_context(context=TaskContext(
+        pkg=pkg, args=args, dependencies={}))
+    assert task._get_build_args() == [
+        '--skip-registry=all',
+        '--compiler=ldc2', '--build=debug', '--parallel',
+        '--combined', 'arg',
+    ]
@@ -0,0 +1,173 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+
+import asyncio
+import json
+import os
+from pathlib import Path
+
+from colcon_dub.dub import DubPackage
+from colcon_dub.dub import find_packages
+
+
+def test_load_is_cached(tmp_path: Path):
+    """Check if a package file is parsed once while it is unchanged."""
+    (tmp_path / 'dub.json').write_text('{"name": "pkg"}')
+    first = DubPackage.load(tmp_path)
+    assert first.name == 'pkg'
+    assert DubPackage.load(tmp_path) is first
+
+
+def test_load_detects_changes(tmp_path: Path):
+    """Check if a modified package file is parsed again."""
+    manifest = tmp_path / 'dub.json'
+    manifest.write_text('{"name": "pkg"}')
+    first = DubPackage.load(tmp_path)
+
+    manifest.write_text('{"name": "other"}')
+    st = manifest.stat()
+    os.utime(manifest, ns=(st.st_atime_ns, st.st_mtime_ns + 1))
+    second = DubPackage.load(tmp_path)
+    assert second is not first
+    assert second.name == 'other'
+
+
+def test_load_without_package_file(tmp_path: Path):
+    """Check if a directory without package file is not a DUB package."""
+    assert DubPackage.load(tmp_path) is None
+
+
+def test_find_packages(tmp_path: Path):
+    """Check if only the requested packages are found."""
+    paths = []
+    for name in ('aaa', 'bbb', 'ccc'):
+        path = tmp_path / 'install' / name / 'lib' / 'dub' / name
+        path.mkdir(parents=True)
+        (path / 'dub.json').write_text('{"name": "%s"}' % name)
+        paths.append(str(path))
+    # A directory which isn't named after its package
+    other = tmp_path / 'other'
+    other.mkdir()
+    (other / 'dub.json').write_text('{"name": "ddd"}')
+    paths.append(str(other))
+
+    found = find_packages(os.pathsep.join(paths), ['ccc', 'aaa', 'ddd'])
+    assert [p.name for p in found] == ['ccc', 'aaa', 'ddd']
+    assert find_packages(os.pathsep.join(paths), ['eee']) == []
+
+
+def test_find_packages_by_prefix(tmp_path: Path, monkeypatch):
+    """Check if packages are found in their prefix without scanning."""
+    prefixes = {}
+    for name in ('aaa', 'bbb'):
+        prefixes[name] = str(tmp_path / 'install' / name)
+        path = tmp_path / 'install' / name / 'lib' / 'dub' / name
+        path.mkdir(parents=True)
+        (path / 'dub.json').write_text('{"name": "%s"}' % name)
+    # A dependency which isn't a DUB package
+    prefixes['cmake_pkg'] = str(tmp_path / 'install' / 'cmake_pkg')
+    dub_package_path = os.pathsep.join(
+        str(Path(prefix) / 'lib' / 'dub' / name)
+        for name, prefix in prefixes.items() if name != 'cmake_pkg')
+
+    found = find_packages('', ['bbb', 'aaa'], prefixes)
+    assert [p.name for p in found] == ['bbb', 'aaa']
+
+    loaded = []
+    load = DubPackage.load
+
+    def record_load(path):
+        loaded.append(Path(path).name)
+        return load(path)
+
+    monkeypatch.setattr(DubPackage, 'load', record_load)
+    found = find_packages(dub_package_path, list(prefixes), prefixes)
+    assert [p.name for p in found] == ['aaa', 'bbb']
+    # Entries named after known packages aren't loaded again
+    assert sorted(loaded) == ['aaa', 'bbb', 'cmake_pkg']
+
+
+def test_find_packages_non_dub_dependency(tmp_path: Path, monkeypatch):
+    """Check if each entry is loaded once with a missing dependency."""
+    paths = []
+    for i in range(10):
+        name = 'pkg{i}'.format_map(locals())
+        path = tmp_path / name
+        path.mkdir()
+        (path / 'dub.json').write_text('{"name": "%s"}' % name)
+        paths.append(str(path))
+    dub_package_path = os.pathsep.join(paths)
+
+    loaded = []
+    load = DubPackage.load
+
+    def record_load(path):
+        loaded.append(Path(path).name)
+        return load(path)
+
+    monkeypatch.setattr(DubPackage, 'load', record_load)
+    # rclcpp is a CMake package, not in DUB_PACKAGE_PATH
+    found = find_packages(dub_package_path, ['pkg3', 'rclcpp'])
+    assert [p.name for p in found] == ['pkg3']
+    assert sorted(loaded) == sorted(Path(p).name for p in paths)
+
+    # The index is reused and rclcpp isn't searched again
+    loaded.clear()
+    found = find_packages(dub_package_path, ['pkg3', 'rclcpp', 'pkg7'])
+    assert [p.name for p in found] == ['pkg3', 'pkg7']
+    assert loaded == ['pkg3', 'pkg7']
+
+
+def test_dependencies(tmp_path: Path):
+    """Check if the dependencies of all configurations are collected."""
+    (tmp_path / 'dub.json').write_text(json.dumps({
+        'name': 'pkg',
+        'dependencies': {'aaa': '~>1.0', 'bbb:sub': '*'},
+        'configurations': [
+            {'name': 'library', 'dependencies': {'ccc': {'path': '../ccc'}}},
+            {'name': 'unittest', 'dependencies': {'silly': '~>1.1.1'}},
+        ],
+    }))
+    dub_package = DubPackage.load(tmp_path)
+    assert set(dub_package.dependencies) == {'aaa', 'bbb', 'ccc', 'silly'}
+
+
+def test_expand_package_name(tmp_path: Path, monkeypatch):
+    """Check if $DUB_PACKAGE is expanded without modifying the environment."""
+    monkeypatch.delenv('DUB_PACKAGE', raising=False)
+    (tmp_path / 'dub.json').write_text(json.dumps({
+        'name': 'pkg',
+        'installFiles': {'share/$DUB_PACKAGE': ['package.xml']},
+        'createFiles': {'share/index': ['${DUB_PACKAGE}', '$UNKNOWN_VAR']},
+    }))
+    dub_package = DubPackage.load(tmp_path)
+    assert dub_package.install_files == {'share/pkg': ['package.xml']}
+    assert dub_package.create_files == {'share/index': ['pkg', '$UNKNOWN_VAR']}
+    assert 'DUB_PACKAGE' not in os.environ
+
+
+def test_create_local_packages(tmp_path: Path):
+    """Check if local-packages.json is only written when it changes."""
+    deps = []
+    for name in ('bbb', 'aaa'):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / 'dub.json').write_text('{"name": "%s"}' % name)
+        deps.append(DubPackage(tmp_path / name))
+    (tmp_path / 'pkg').mkdir()
+    (tmp_path / 'pkg' / 'dub.json').write_text('{"name": "pkg"}')
+    dub = DubPackage(tmp_path / 'pkg')
+    local_path = tmp_path / 'pkg' / '.dub' / 'packages' / \
+        'local-packages.json'
+
+    assert asyncio.run(dub.create_local_packages(deps))
+    assert [p['name'] for p in json.loads(local_path.read_text())] == \
+        ['aaa', 'bbb']
+    mtime = local_path.stat().st_mtime_ns
+
+    assert not asyncio.run(dub.create_local_packages(list(reversed(deps))))
+    assert local_path.stat().st_mtime_ns == mtime
+
+    assert asyncio.run(dub.create_local_packages(deps[:1]))
+    assert [p['name'] for p in json.loads(local_path.read_text())] == \
+        ['bbb']
+    assert not local_path.with_name('local-packages.json.tmp').exists()
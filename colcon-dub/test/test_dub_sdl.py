@@ -0,0 +1,80 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+
+import json
+from pathlib import Path
+
+from colcon_dub.dub import DubPackage
+from colcon_dub.dub.sdl import parse_sdl
+from colcon_dub.dub.sdl import to_json
+import pytest
+
+PATH_TO_THIS = Path(__file__).absolute().parent
+
+# The SDL version of dub_test_package/dub.json
+DUB_TEST_PACKAGE_SDL = r'''
+authors "nonanonno"
+copyright "Copyright © 2021, nonanonno"
+description "test package"
+license "Apache-2.0"
+name "dub_test_package"
+version "0.0.1"
+configuration "dub_test_package" {
+    targetType "executable"
+}
+configuration "unittest" {
+    targetType "library"
+}
+dependency "silly" version="~>1.1.1"
+installFiles "share/$DUB_PACKAGE/test_install" "aaa.txt" "bbb"
+installFiles "share/$DUB_PACKAGE/test_install/$DUB_PACKAGE" \
+    "directory/ccc.txt"
+createFiles "share/$DUB_PACKAGE/test_create" "aaa" "bbb"
+createFiles "share/$DUB_PACKAGE/test_create/second" "ccc"
+'''
+
+
+def test_same_as_json():
+    """Check if SDL is converted to the structure of the JSON recipe."""
+    with open(PATH_TO_THIS / 'dub_test_package' / 'dub.json') as f:
+        expected = json.load(f)
+    assert to_json(parse_sdl(DUB_TEST_PACKAGE_SDL)) == expected
+
+
+def test_values():
+    """Check if the SDLang value types are parsed."""
+    tags = parse_sdl(
+        'tag "a\\tb" `c\\d` 1 -2 3.5 10L true off null // comment\n'
+        '/* multi\nline */ other; third key="value" flag=on\n')
+    assert [t.name for t in tags] == ['tag', 'other', 'third']
+    assert tags[0].values == ['a\tb', 'c\\d', 1, -2, 3.5, 10, True, False,
+                              None]
+    assert tags[2].attributes == {'key': 'value', 'flag': True}
+
+
+@pytest.mark.parametrize('text', [
+    'name "unterminated',
+    'configuration "x" {',
+    'name "x" }',
+    'date 2021/01/01',
+    'name x',
+    'tag key="value" "value"',
+])
+def test_invalid(text):
+    """Check if invalid documents are rejected."""
+    with pytest.raises(RuntimeError):
+        parse_sdl(text)
+
+
+def test_load_package(tmp_path: Path):
+    """Check if a package with dub.sdl is loaded."""
+    (tmp_path / 'dub.sdl').write_text(DUB_TEST_PACKAGE_SDL)
+    dub_package = DubPackage.load(tmp_path)
+    assert dub_package.name == 'dub_test_package'
+    assert [c.name for c in dub_package.configurations] == \
+        ['dub_test_package', 'unittest']
+    assert dub_package.install_files == {
+        'share/dub_test_package/test_install': ['aaa.txt', 'bbb'],
+        'share/dub_test_package/test_install/dub_test_package':
+            ['directory/ccc.txt'],
+    }
@@ -0,0 +1,82 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+
+import asyncio
+import json
+from pathlib import Path
+import subprocess
+
+from colcon_dub.dub import DubPackage
+from colcon_dub.dub import fetch
+from colcon_dub.dub.fetch import get_external_dependencies
+
+
+def test_get_external_dependencies(tmp_path: Path):
+    """Check if all selected versions are fetched, not only direct ones."""
+    (tmp_path / 'dub.json').write_text(json.dumps({
+        'name': 'pkg',
+        'dependencies': {
+            'aaa': '~>1.0',
+            'local': '*',
+            'near': {'path': '../near'},
+            'maybe': {'version': '*', 'optional': True},
+        },
+    }))
+    dub = DubPackage(tmp_path)
+
+    # Without selections the direct dependencies are used
+    assert get_external_dependencies(dub, ['local']) == {'aaa': '~>1.0'}
+
+    (tmp_path / 'dub.selections.json').write_text(json.dumps({
+        'fileVersion': 1,
+        'versions': {
+            'aaa': '1.2.3',
+            'indirect': '0.4.0',
+            'local': '1.0.0',
+            'near': {'path': '../near'},
+        },
+    }))
+    assert get_external_dependencies(dub, ['local']) == {
+        'aaa': '1.2.3', 'indirect': '0.4.0'}
+
+
+def test_prefetch_indirect_dependencies(tmp_path: Path, monkeypatch):
+    """Check if a package without selections is resolved before fetching."""
+    src = tmp_path / 'src'
+    src.mkdir()
+    (src / 'dub.json').write_text(json.dumps({
+        'name': 'pkg', 'dependencies': {'aaa': '~>1.0'}}))
+    dub = DubPackage(src)
+    # The isolated build invokes DUB in a mirror, where the selections are
+    # written
+    mirror = tmp_path / 'mirror'
+    mirror.mkdir()
+    cmds = []
+
+    async def run(context, cmd, cwd=None, env=None):
+        cmds.append(cmd[1:])
+        if cmd[1] == 'upgrade':
+            assert cwd == str(mirror)
+            (mirror / 'dub.selections.json').write_text(json.dumps({
+                'fileVersion': 1,
+                'versions': {'aaa': '1.2.3', 'indirect': '0.4.0'},
+            }))
+        return subprocess.CompletedProcess(cmd, 0)
+
+    monkeypatch.setattr(fetch, 'DUB_EXECUTABLE', 'dub')
+    monkeypatch.setattr(fetch, 'run', run)
+    monkeypatch.setattr(fetch, '_fetches', {})
+    assert asyncio.run(fetch.prefetch_dependencies(
+        None, dub, mirror, [], {})) is None
+    assert cmds == [
+        ['upgrade', '--missing-only'],
+        ['fetch', 'aaa@1.2.3'],
+        ['fetch', 'indirect@0.4.0'],
+    ]
+
+    # The selections are read from the mirror without resolving again
+    cmds.clear()
+    monkeypatch.setattr(fetch, '_fetches', {})
+    assert asyncio.run(fetch.prefetch_dependencies(
+        None, dub, mirror, [], {})) is None
+    assert cmds == [['fetch', 'aaa@1.2.3'], ['fetch', 'indirect@0.4.0']]
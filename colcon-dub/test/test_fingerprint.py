@@ -0,0 +1,212 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+
+import argparse
+import asyncio
+import json
+import os
+from pathlib import Path
+
+from colcon_core.package_descriptor import PackageDescriptor
+from colcon_core.task import TaskContext
+from colcon_dub.dub import DubPackage
+from colcon_dub.dub.fingerprint import combine
+from colcon_dub.dub.fingerprint import get_components
+from colcon_dub.dub.fingerprint import SourceHashes
+from colcon_dub.dub.fingerprint import write_fingerprint
+from colcon_dub.dub.timing import PhaseTimer
+from colcon_dub.task.dub.build import DubBuildTask
+
+ENV = {'DC': 'colcon-dub-missing-compiler', 'PATH': ''}
+
+
+def _touch(path: Path):
+    st = path.stat()
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+
+
+def _create_package(path: Path, name: str = 'pkg') -> DubPackage:
+    (path / 'source').mkdir(parents=True)
+    (path / 'source' / 'lib.d').write_text('module lib;')
+    (path / 'dub.json').write_text(json.dumps({
+        'name': name,
+        'configurations': [
+            {'name': 'library', 'targetType': 'library'},
+            {'name': 'unittest', 'targetType': 'library'},
+        ],
+    }))
+    return DubPackage(path)
+
+
+def test_source_hashes(tmp_path: Path):
+    """Check if hashes are reused until the size or mtime changes."""
+    src = tmp_path / 'src'
+    src.mkdir()
+    (src / 'a.d').write_text('a')
+    (src / 'b.d').write_text('b')
+    hashes_path = tmp_path / 'hashes.json'
+
+    hashes = SourceHashes(hashes_path)
+    digest = hashes.digest(src)
+    assert hashes.modified
+    hashes.save()
+
+    hashes = SourceHashes(hashes_path)
+    # A cached hash is trusted while the size and mtime are unchanged
+    hashes.hashes['a.d'][2] = 'cached'
+    assert hashes.digest(src) != digest
+    assert not hashes.modified
+
+    # A changed mtime invalidates the hash
+    hashes = SourceHashes(hashes_path)
+    _touch(src / 'a.d')
+    assert hashes.digest(src) == digest
+    assert hashes.modified
+
+    # A changed size invalidates the hash even with the same mtime
+    hashes = SourceHashes(hashes_path)
+    st = (src / 'a.d').stat()
+    (src / 'a.d').write_text('aa')
+    os.utime(src / 'a.d', ns=(st.st_atime_ns, st.st_mtime_ns))
+    assert hashes.digest(src) != digest
+    assert hashes.modified
+
+
+def test_get_components(tmp_path: Path):
+    """Check if dependencies, the compiler and generated files count."""
+    dub = _create_package(tmp_path / 'pkg')
+    dep = _create_package(tmp_path / 'dep', 'dep')
+    hashes = SourceHashes()
+
+    def components(dub_args=()):
+        return asyncio.run(get_components(
+            dub, ENV, [dep], list(dub_args), hashes))
+
+    first = components()
+    assert first['compiler'] == 'colcon-dub-missing-compiler'
+    assert components(['--compiler=ldc2'])['compiler'] == 'ldc2'
+    assert components(['--compiler', 'gdc'])['compiler'] == 'gdc'
+
+    # The published fingerprint of a dependency takes precedence
+    write_fingerprint(dep.path, 'published')
+    assert components()['dependencies'] == {'dep': 'published'}
+
+    # dub build creates dub.selections.json on the first build
+    assert first['selections'] is None
+    selections = {'fileVersion': 1, 'versions': {
+        'aaa': '1.0.0', 'near': {'path': '../near'}}}
+    (dub.path / 'dub.selections.json').write_text(json.dumps(selections))
+    assert components()['sources'] == first['sources']
+    assert components()['selections'] == {'aaa': '1.0.0'}
+
+    # dub upgrade selects another version
+    upgraded = components()
+    selections['versions']['aaa'] = '1.1.0'
+    (dub.path / 'dub.selections.json').write_text(json.dumps(selections))
+    assert components()['sources'] == first['sources']
+    assert combine(components()) != combine(upgraded)
+    (dub.path / 'source' / 'lib.d').write_text('module lib; int x;')
+    assert components()['sources'] != first['sources']
+
+
+def _create_task(tmp_path: Path, dub: DubPackage, argv=()):
+    parser = argparse.ArgumentParser()
+    DubBuildTask().add_arguments(parser=parser)
+    args = parser.parse_args(list(argv))
+    args.dub_artifact_cache = None
+    args.path = str(dub.path)
+    args.build_base = str(tmp_path / 'build')
+    args.install_base = str(tmp_path / 'install')
+    desc = PackageDescriptor(dub.path)
+    desc.name = dub.name
+    task = DubBuildTask()
+    task.set_context(context=TaskContext(
+        pkg=desc, args=args, dependencies={}))
+    task.context.put_event_into_queue = lambda event: None
+    task._timer = PhaseTimer(dub.name, 'build')
+    task._dub_path = dub.path
+
+    built = []
+
+    async def build_configuration(dub, config, env, fingerprint, **kwargs):
+        built.append(config.name)
+        task._record_configuration(config, fingerprint)
+
+    task._build_configuration = build_configuration
+    return task, built
+
+
+def test_build_skipped_when_up_to_date(tmp_path: Path):
+    """Check if unchanged configurations are only built when forced."""
+    dub = _create_package(tmp_path / 'pkg')
+
+    task, built = _create_task(tmp_path, dub)
+    asyncio.run(task._build(dub, ENV, []))
+    assert built == ['library', 'unittest']
+
+    task, built = _create_task(tmp_path, dub)
+    asyncio.run(task._build(dub, ENV, []))
+    assert built == []
+
+    task, built = _create_task(tmp_path, dub, ['--dub-force-build'])
+    asyncio.run(task._build(dub, ENV, []))
+    assert built == ['library', 'unittest']
+
+    (dub.path / 'source' / 'lib.d').write_text('module lib; int x;')
+    task, built = _create_task(tmp_path, dub)
+    asyncio.run(task._build(dub, ENV, []))
+    assert built == ['library', 'unittest']
+
+
+def test_parallel_configurations_start_after_first(tmp_path: Path):
+    """Check if the first configuration is built before the others."""
+    _create_package(tmp_path / 'pkg')
+    (tmp_path / 'pkg' / 'dub.json').write_text(json.dumps({
+        'name': 'pkg',
+        'configurations': [
+            {'name': name, 'targetType': 'library'}
+            for name in ('library', 'unittest', 'other')],
+    }))
+    dub = DubPackage(tmp_path / 'pkg')
+    task, built = _create_task(
+        tmp_path, dub,
+        ['--dub-parallel-configurations', '--dub-configuration-jobs', '2'])
+    events = []
+
+    async def build_configuration(dub, config, env, fingerprint, **kwargs):
+        events.append(('start', config.name))
+        await asyncio.sleep(0.01)
+        events.append(('end', config.name))
+
+    task._build_configuration = build_configuration
+    asyncio.run(task._build(dub, ENV, []))
+    assert events[:2] == [('start', 'library'), ('end', 'library')]
+    # The others run concurrently
+    assert events[2:4] == [('start', 'unittest'), ('start', 'other')]
+
+
+def test_build_writing_selections_up_to_date(tmp_path: Path):
+    """Check if dub.selections.json written by the build is recorded."""
+    dub = _create_package(tmp_path / 'pkg')
+    selections = {'fileVersion': 1, 'versions': {'aaa': '1.0.0'}}
+
+    task, built = _create_task(tmp_path, dub)
+
+    async def build_configuration(dub, config, env, fingerprint, **kwargs):
+        built.append(config.name)
+        (dub.path / 'dub.selections.json').write_text(json.dumps(selections))
+        task._record_configuration(config, fingerprint)
+
+    task._build_configuration = build_configuration
+    asyncio.run(task._build(dub, ENV, []))
+    assert built == ['library', 'unittest']
+
+    task, built = _create_task(tmp_path, dub)
+    asyncio.run(task._build(dub, ENV, []))
+    assert built == []
+
+    selections['versions']['aaa'] = '1.1.0'
+    (dub.path / 'dub.selections.json').write_text(json.dumps(selections))
+    task, built = _create_task(tmp_path, dub)
+    asyncio.run(task._build(dub, ENV, []))
+    assert built == ['library', 'unittest']
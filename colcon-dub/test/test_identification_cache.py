@@ -0,0 +1,74 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+
+import json
+import os
+from pathlib import Path
+
+from colcon_core.package_descriptor import PackageDescriptor
+from colcon_dub.dub import identification_cache
+from colcon_dub.dub.identification_cache import IdentificationCache
+from colcon_dub.package_identification import dub as identification
+
+
+def _identify(path: Path) -> PackageDescriptor:
+    desc = PackageDescriptor(path)
+    identification.DubPackageIdentification().identify(desc)
+    return desc
+
+
+def test_identification_cache(tmp_path: Path, monkeypatch):
+    """Check if unchanged packages are identified without parsing."""
+    cache_path = tmp_path / 'cache' / 'identification.json'
+    monkeypatch.setattr(
+        identification_cache, '_cache', IdentificationCache(cache_path))
+    pkg = tmp_path / 'pkg'
+    pkg.mkdir()
+    (pkg / 'dub.json').write_text(json.dumps({
+        'name': 'pkg', 'dependencies': {'dep': '*'}}))
+
+    desc = _identify(pkg)
+    assert desc.name == 'pkg'
+    identification_cache._cache.save()
+    assert cache_path.is_file()
+
+    # A new invocation reads the cache instead of the recipe
+    monkeypatch.setattr(
+        identification_cache, '_cache', IdentificationCache(cache_path))
+
+    def load(path):
+        raise AssertionError('The recipe must not be parsed')
+
+    with monkeypatch.context() as m:
+        m.setattr(identification.DubPackage, 'load', load)
+        desc = _identify(pkg)
+    assert desc.type == 'dub'
+    assert desc.name == 'pkg'
+    assert {d.name for d in desc.dependencies['build']} == {'dep'}
+
+    # A changed recipe is parsed again
+    (pkg / 'dub.json').write_text(json.dumps({'name': 'renamed'}))
+    st = (pkg / 'dub.json').stat()
+    os.utime(pkg / 'dub.json', ns=(st.st_atime_ns, st.st_mtime_ns + 1000))
+    desc = _identify(pkg)
+    assert desc.name == 'renamed'
+    assert not desc.dependencies['build']
+
+
+def test_identification_cache_opt_in(tmp_path: Path, monkeypatch):
+    """Check if the cache is only used when its path is set."""
+    variable = identification_cache.IDENTIFICATION_CACHE_ENVIRONMENT_VARIABLE
+    monkeypatch.delenv(variable.name, raising=False)
+    monkeypatch.setattr(identification_cache, '_cache', None)
+    assert identification_cache.get_identification_cache() is None
+
+    monkeypatch.setenv(variable.name, '')
+    monkeypatch.setattr(identification_cache, '_cache', None)
+    assert identification_cache.get_identification_cache() is None
+
+    cache_path = tmp_path / 'identification.json'
+    monkeypatch.setenv(variable.name, str(cache_path))
+    monkeypatch.setattr(identification_cache, '_cache', None)
+    monkeypatch.setattr(identification_cache.atexit, 'register', id)
+    assert identification_cache.get_identification_cache().path == \
+        cache_path
@@ -0,0 +1,123 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+
+import json
+from pathlib import Path
+
+from colcon_dub.dub import DubPackage
+from colcon_dub.dub.install import collect_files
+from colcon_dub.dub.install import get_install_filter
+from colcon_dub.dub.install import InstallManifest
+from colcon_dub.dub.install import sync_files
+
+
+def _sync(src: Path, install_base: Path, manifest_path: Path) -> int:
+    files = collect_files(src, 'lib/dub/pkg')
+    files['share/marker'] = None
+    copied, _ = sync_files(
+        files, install_base, InstallManifest(manifest_path))
+    return copied
+
+
+def test_sync_files_incremental(tmp_path: Path):
+    """Check if only new or changed files are copied."""
+    src = tmp_path / 'src'
+    (src / 'source').mkdir(parents=True)
+    (src / 'dub.json').write_text('{"name": "pkg"}')
+    (src / 'source' / 'app.d').write_text('void main() {}')
+    install_base = tmp_path / 'install'
+    manifest = tmp_path / 'build' / 'install_manifest.json'
+
+    assert _sync(src, install_base, manifest) == 3
+    assert (install_base / 'lib/dub/pkg/source/app.d').is_file()
+    assert (install_base / 'share/marker').is_file()
+
+    assert _sync(src, install_base, manifest) == 0
+
+    (src / 'source' / 'app.d').write_text('void main() { return; }')
+    assert _sync(src, install_base, manifest) == 1
+    assert (install_base / 'lib/dub/pkg/source/app.d').read_text() == \
+        'void main() { return; }'
+
+
+def test_sync_files_remove_stale(tmp_path: Path):
+    """Check if files which are not installed anymore are removed."""
+    src = tmp_path / 'src'
+    (src / 'source').mkdir(parents=True)
+    (src / 'source' / 'app.d').write_text('void main() {}')
+    install_base = tmp_path / 'install'
+    manifest = tmp_path / 'build' / 'install_manifest.json'
+
+    _sync(src, install_base, manifest)
+    (src / 'source' / 'app.d').unlink()
+    _sync(src, install_base, manifest)
+
+    assert not (install_base / 'lib/dub/pkg/source').exists()
+    assert (install_base / 'share/marker').is_file()
+
+
+def test_sync_files_links(tmp_path: Path):
+    """Check if files are installed as links and never written through."""
+    src = tmp_path / 'src'
+    src.mkdir()
+    (src / 'app.d').write_text('void main() {}')
+    install_base = tmp_path / 'install'
+    manifest = InstallManifest(tmp_path / 'build' / 'install_manifest.json')
+    installed = install_base / 'lib/dub/pkg/app.d'
+
+    files = collect_files(src, 'lib/dub/pkg')
+    assert sync_files(files, install_base, manifest, mode='symlink') == \
+        (1, 0)
+    assert installed.is_symlink()
+    assert sync_files(files, install_base, manifest, mode='symlink') == \
+        (0, 0)
+
+    assert sync_files(files, install_base, manifest, mode='hardlink')[0] == 1
+    assert not installed.is_symlink()
+    assert installed.samefile(src / 'app.d')
+    assert sync_files(files, install_base, manifest, mode='hardlink')[0] == 0
+
+    # Replacing the hardlink with a copy must not modify the source
+    sync_files(files, install_base, manifest, mode='copy')
+    assert not installed.samefile(src / 'app.d')
+    installed.write_text('modified')
+    assert (src / 'app.d').read_text() == 'void main() {}'
+
+    sync_files(files, install_base, manifest, mode='reflink')
+    assert installed.read_text() == 'void main() {}'
+
+
+def test_install_filter(tmp_path: Path):
+    """Check if DUB caches and build outputs are not installed."""
+    (tmp_path / 'dub.json').write_text(json.dumps({
+        'name': 'pkg',
+        'configurations': [
+            {'name': 'app', 'targetType': 'executable', 'targetPath': 'bin'},
+            {'name': 'lib', 'targetType': 'library'},
+        ],
+        'installExclude': ['*.log'],
+        'installInclude': ['keep.o'],
+    }))
+    for path in (
+        'source/app.d', 'source/app.o', 'keep.o', '.dub/build/x.o',
+        '.gitignore', 'bin/app', 'bin/app.exe', 'bin/pkg-test-app',
+        'liblib.a', 'build.log', 'docs/bin/app',
+    ):
+        (tmp_path / path).parent.mkdir(parents=True, exist_ok=True)
+        (tmp_path / path).write_text('')
+
+    dub = DubPackage(tmp_path)
+    files = collect_files(
+        tmp_path, 'lib/dub/pkg',
+        get_install_filter(dub, excludes=['docs']))
+    assert sorted(files.keys()) == [
+        'lib/dub/pkg/dub.json',
+        'lib/dub/pkg/keep.o',
+        'lib/dub/pkg/source/app.d',
+    ]
+
+    files = collect_files(
+        tmp_path, 'lib/dub/pkg',
+        get_install_filter(dub, includes=['app.exe']))
+    assert 'lib/dub/pkg/bin/app.exe' in files
+    assert 'lib/dub/pkg/docs/bin/app' in files
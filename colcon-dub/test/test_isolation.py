@@ -0,0 +1,101 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+
+import json
+from pathlib import Path
+
+import pytest
+
+from colcon_dub.dub import DubPackage
+from colcon_dub.dub.isolation import get_isolated_path
+from colcon_dub.dub.isolation import mirror_package
+from colcon_dub.dub.isolation import remove_mirror
+
+
+def test_mirror_package(tmp_path: Path):
+    """Check if the mirror links sources and never links output paths."""
+    src = tmp_path / 'src'
+    (src / 'source').mkdir(parents=True)
+    (src / 'source' / 'app.d').write_text('void main() {}')
+    (src / 'bin' / 'data').mkdir(parents=True)
+    (src / '.dub').mkdir()
+    (src / 'app').write_text('stale output')
+    (src / 'dub.json').write_text(json.dumps({
+        'name': 'app',
+        'configurations': [
+            {'name': 'app', 'targetType': 'executable'},
+            {'name': 'tool', 'targetType': 'executable',
+             'targetPath': 'bin/tool'},
+        ],
+    }))
+    build_base = tmp_path / 'build'
+    assert get_isolated_path(build_base) is None
+
+    path = mirror_package(DubPackage(src), build_base)
+    assert get_isolated_path(build_base) == path
+    assert (path / 'source').is_symlink()
+    assert (path / 'source' / 'app.d').read_text() == 'void main() {}'
+    assert not (path / 'dub.json').is_symlink()
+    assert not (path / 'bin').is_symlink()
+    assert (path / 'bin' / 'data').is_symlink()
+    assert not (path / '.dub').exists()
+    assert not (path / 'app').exists()
+
+    # Outputs of DUB are kept, links to removed sources are not
+    (path / 'app').write_text('output')
+    (src / 'source' / 'app.d').rename(src / 'app.d')
+    (src / 'source').rmdir()
+    mirror_package(DubPackage(src), build_base)
+    assert not (path / 'source').is_symlink()
+    assert (path / 'app.d').is_symlink()
+    assert (path / 'app').read_text() == 'output'
+
+    remove_mirror(build_base)
+    assert get_isolated_path(build_base) is None
+    assert (src / 'app.d').exists()
+
+
+def test_mirror_relative_paths(tmp_path: Path):
+    """Check if paths leaving the package stay valid in the mirror."""
+    src = tmp_path / 'src'
+    (src / 'source').mkdir(parents=True)
+    (tmp_path / 'common').mkdir()
+    (src / 'dub.json').write_text(json.dumps({
+        'name': 'app',
+        'sourcePaths': ['source', '../common'],
+        'importPaths-posix': ['../common'],
+        'dependencies': {
+            'dep': {'path': '../dep'},
+            'sub': {'path': 'sub'},
+            'reg': '~>1.0',
+        },
+        'configurations': [
+            {'name': 'app', 'stringImportPaths': ['../views']},
+        ],
+    }))
+    (src / 'dub.selections.json').write_text(json.dumps({
+        'fileVersion': 1,
+        'versions': {'dep': {'path': '../dep'}, 'reg': '1.0.0'},
+    }))
+
+    path = mirror_package(DubPackage(src), tmp_path / 'build')
+    recipe = json.loads((path / 'dub.json').read_text())
+    assert recipe['sourcePaths'] == ['source', str(tmp_path / 'common')]
+    assert recipe['importPaths-posix'] == [str(tmp_path / 'common')]
+    assert recipe['dependencies'] == {
+        'dep': {'path': str(tmp_path / 'dep')},
+        'sub': {'path': 'sub'},
+        'reg': '~>1.0',
+    }
+    assert recipe['configurations'][0]['stringImportPaths'] == \
+        [str(tmp_path / 'views')]
+    selections = json.loads((path / 'dub.selections.json').read_text())
+    assert selections['versions'] == {
+        'dep': {'path': str(tmp_path / 'dep')}, 'reg': '1.0.0'}
+
+    # dub.sdl can't be rewritten
+    (src / 'dub.json').unlink()
+    (src / 'dub.sdl').write_text(
+        'name "app"\ndependency "dep" path="../dep"\n')
+    with pytest.raises(RuntimeError, match='../dep'):
+        mirror_package(DubPackage(src), tmp_path / 'build')
@@ -0,0 +1,303 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+
+import argparse
+import asyncio
+import json
+from pathlib import Path
+import re
+import subprocess
+from xml.etree import ElementTree
+
+from colcon_core.package_descriptor import PackageDescriptor
+from colcon_core.task import TaskContext
+from colcon_dub.dub import DubPackage
+from colcon_dub.dub.testing import BUILD_ONLY_ENV
+from colcon_dub.dub.testing import CachedTestResult
+from colcon_dub.dub.testing import find_modules
+from colcon_dub.dub.testing import find_test_binary
+from colcon_dub.dub.testing import shard_filters
+from colcon_dub.dub.testing import store_test_binary
+from colcon_dub.dub.testing import TEST_MAIN
+from colcon_dub.dub.testing import write_junit
+from colcon_dub.dub.timing import PhaseTimer
+from colcon_dub.task.dub import build as build_task
+from colcon_dub.task.dub import test as test_task
+
+ENV = {'DC': 'colcon-dub-missing-compiler', 'PATH': ''}
+
+
+def test_find_modules(tmp_path: Path):
+    """Check if module names are read from declarations or paths."""
+    (tmp_path / 'dub.json').write_text(json.dumps({'name': 'pkg'}))
+    source = tmp_path / 'source'
+    (source / 'pkg').mkdir(parents=True)
+    (source / 'app.d').write_text('void main() {}')
+    (source / 'pkg' / 'package.d').write_text('// comment\nmodule pkg;')
+    (source / 'pkg' / 'util.d').write_text('module  pkg . util ;')
+    (source / 'pkg' / 'impl.d').write_text('unittest {}')
+
+    assert find_modules(DubPackage(tmp_path)) == \
+        ['app', 'pkg', 'pkg.impl', 'pkg.util']
+
+
+def test_shard_filters():
+    """Check if every test is selected by exactly one shard."""
+    modules = ['app', 'pkg', 'pkg.util']
+    filters = shard_filters(modules, 2)
+    assert len(filters) == 2
+    for test in ('app.main', 'pkg.__unittest_L3_C1', 'pkg.util.name'):
+        assert sum(bool(re.match(f, test)) for f in filters) == 1
+
+    assert len(shard_filters(modules, 5)) == 3
+
+
+def test_cached_test_result(tmp_path: Path):
+    """Check if the result and output of a test run are recorded."""
+    log_paths = [tmp_path / 'a.log', tmp_path / 'b.log']
+    log_paths[0].write_text('a passed\n')
+    log_paths[1].write_text('b failed\n')
+    cache_path = tmp_path / 'build' / 'test_result_cache.json'
+
+    assert CachedTestResult(cache_path).fingerprint is None
+    CachedTestResult(cache_path).save('1234', 1, log_paths)
+
+    cached = CachedTestResult(cache_path)
+    assert cached.fingerprint == '1234'
+    assert cached.returncode == 1
+    assert cached.output == 'a passed\nb failed\n'
+
+
+SILLY_OUTPUT = """\
+Running ./dub_test_package-test-unittest
+ \x1b[32m\u2713\x1b[0m app success (0.250 ms)
+ \x1b[31m\u2717\x1b[0m app fail (1.500 ms)
+    core.exception.AssertError thrown from source/app.d on line 25
+    --- Stack trace ---
+
+Summary: 1 passed, 1 failed in 2 ms
+"""
+
+
+def test_write_junit(tmp_path: Path):
+    """Check if the results of silly are converted to JUnit XML."""
+    path = tmp_path / 'test_results' / 'pkg' / 'dub-unittest.xml'
+    write_junit(path, 'pkg.unittest', SILLY_OUTPUT, 1, 0.5)
+
+    suite = ElementTree.parse(str(path)).getroot().find('testsuite')
+    assert suite.get('tests') == '2'
+    assert suite.get('failures') == '1'
+    cases = suite.findall('testcase')
+    assert [(c.get('classname'), c.get('name')) for c in cases] == \
+        [('app', 'success'), ('app', 'fail')]
+    assert float(cases[1].get('time')) == 0.0015
+    failure = cases[1].find('failure')
+    assert failure.get('message') == \
+        'core.exception.AssertError thrown from source/app.d on line 25'
+
+
+def test_write_junit_without_silly(tmp_path: Path):
+    """Check if the output of other test runners becomes one test case."""
+    path = tmp_path / 'dub-default.xml'
+    write_junit(path, 'pkg.default', '1 modules passed unittests\n', None, 2)
+
+    suite = ElementTree.parse(str(path)).getroot().find('testsuite')
+    assert suite.get('tests') == '1'
+    assert suite.get('failures') == '0'
+    assert suite.find('testcase').get('time') == '2.000000'
+
+
+def test_store_test_binary(tmp_path: Path):
+    """Check if a stored unittest executable is found until it is stale."""
+    (tmp_path / 'dub.json').write_text(json.dumps({
+        'name': 'my.pkg',
+        'configurations': [
+            {'name': 'unittest', 'targetType': 'library', 'targetPath': 'bin'},
+        ],
+    }))
+    dub = DubPackage(tmp_path)
+    binaries = tmp_path / 'build' / 'test_binaries'
+
+    assert not store_test_binary(binaries, dub, 'unittest', 'a')
+    assert find_test_binary(binaries, dub, 'unittest', 'a') is None
+
+    binary = dub.test_object_path(dub.configurations[0])
+    assert binary.parent.name == 'bin'
+    assert binary.name.startswith('my_pkg-test-unittest')
+    (tmp_path / binary).parent.mkdir()
+    (tmp_path / binary).write_text('')
+    assert store_test_binary(binaries, dub, 'unittest', 'a')
+    assert find_test_binary(binaries, dub, 'unittest', 'a') == \
+        binaries / binary.name
+    assert find_test_binary(binaries, dub, 'unittest', 'b') is None
+
+
+def _create_test_task(
+    tmp_path: Path, dub: DubPackage, monkeypatch, argv=(), dependencies=None
+):
+    monkeypatch.setattr(test_task, 'DUB_EXECUTABLE', 'dub')
+    parser = argparse.ArgumentParser()
+    test_task.DubTestTask().add_arguments(parser=parser)
+    args = parser.parse_args(list(argv))
+    args.path = str(dub.path)
+    args.build_base = str(tmp_path / 'build')
+    args.install_base = str(tmp_path / 'install')
+    args.test_result_base = None
+    desc = PackageDescriptor(dub.path)
+    desc.name = dub.name
+    task = test_task.DubTestTask()
+    task.set_context(context=TaskContext(
+        pkg=desc, args=args, dependencies=dependencies or {}))
+    task.context.put_event_into_queue = lambda event: None
+    task._timer = PhaseTimer(dub.name, 'test')
+
+    runs = []
+
+    async def run_tests(config, shard, test_filter, env, semaphore, binary,
+                        *, capture):
+        runs.append(('start', config, binary))
+        await asyncio.sleep(0.01)
+        runs.append(('end', config, binary))
+        return None, tmp_path / 'test.log'
+
+    task._run_tests = run_tests
+    return task, runs
+
+
+def test_first_configuration_tested_alone(tmp_path: Path, monkeypatch):
+    """Check if the first configuration is tested before the others."""
+    (tmp_path / 'dub.json').write_text(json.dumps({
+        'name': 'pkg',
+        'configurations': [
+            {'name': name, 'targetType': 'library'}
+            for name in ('library', 'unittest', 'unittest-a', 'unittest-b')],
+    }))
+    (tmp_path / 'test.log').write_text('')
+    dub = DubPackage(tmp_path)
+    task, runs = _create_test_task(tmp_path, dub, monkeypatch)
+    assert asyncio.run(task._test(dub, ENV)) is None
+    events = [(event, config) for event, config, _ in runs]
+    assert events[:2] == [('start', 'unittest'), ('end', 'unittest')]
+    # The others run concurrently
+    assert events[2:4] == [('start', 'unittest-a'), ('start', 'unittest-b')]
+
+
+def test_test_results_path(tmp_path: Path, monkeypatch):
+    """Check if the package directory of --test-result-base is used."""
+    (tmp_path / 'dub.json').write_text(json.dumps({'name': 'pkg'}))
+    (tmp_path / 'test.log').write_text('')
+    dub = DubPackage(tmp_path)
+
+    task, _ = _create_test_task(tmp_path, dub, monkeypatch)
+    asyncio.run(task._test(dub, ENV))
+    assert task._test_results_path == \
+        tmp_path / 'build' / 'test_results' / 'pkg'
+
+    # colcon appends the package name to --test-result-base itself
+    task, _ = _create_test_task(
+        tmp_path, dub, monkeypatch, ['--dub-test-force'])
+    task.context.args.test_result_base = str(tmp_path / 'results' / 'pkg')
+    asyncio.run(task._test(dub, ENV))
+    assert task._test_results_path == tmp_path / 'results' / 'pkg'
+
+
+def test_build_tests(tmp_path: Path, monkeypatch):
+    """Check if the executable stored by the build task is run by the test."""
+    pkg = tmp_path / 'pkg'
+    pkg.mkdir()
+    (pkg / 'dub.json').write_text(json.dumps({
+        'name': 'pkg',
+        'configurations': [
+            {'name': 'library', 'targetType': 'library'},
+            {'name': 'unittest', 'targetType': 'library'},
+        ],
+    }))
+    (tmp_path / 'test.log').write_text('')
+    dub = DubPackage(pkg)
+    # colcon test passes the installed package itself as a dependency
+    installed = tmp_path / 'install' / 'pkg' / 'lib' / 'dub' / 'pkg'
+    installed.mkdir(parents=True)
+    (installed / 'dub.json').write_text((pkg / 'dub.json').read_text())
+
+    object_path = pkg / dub.test_object_path(dub.configurations[1])
+
+    returncodes = [1, 0]
+
+    async def run(context, cmd, cwd=None, env=None):
+        # The unittests aren't run by the build
+        main_file = tmp_path / 'build' / 'colcon_dub' / \
+            'colcon_dub_test_main.d'
+        assert cmd[:5] == [
+            'dub', 'test', '-c', 'unittest',
+            '--main-file={main_file}'.format_map(locals())]
+        assert main_file.read_text() == TEST_MAIN
+        assert env[BUILD_ONLY_ENV] == '1'
+        object_path.write_text('')
+        return subprocess.CompletedProcess(cmd, returncodes.pop(0))
+
+    monkeypatch.setattr(build_task, 'DUB_EXECUTABLE', 'dub')
+    monkeypatch.setattr(build_task, 'run', run)
+    parser = argparse.ArgumentParser()
+    build_task.DubBuildTask().add_arguments(parser=parser)
+    args = parser.parse_args(['--dub-build-tests'])
+    args.path = str(pkg)
+    args.build_base = str(tmp_path / 'build')
+    args.install_base = str(tmp_path / 'install' / 'pkg')
+    desc = PackageDescriptor(pkg)
+    desc.name = 'pkg'
+    task = build_task.DubBuildTask()
+    task.set_context(context=TaskContext(
+        pkg=desc, args=args, dependencies={}))
+    task.context.put_event_into_queue = lambda event: None
+    task._timer = PhaseTimer('pkg', 'build')
+    task._dub_path = pkg
+    # A failed build isn't stored
+    assert asyncio.run(task._build_tests(dub, ENV, [])) == 1
+    assert not (tmp_path / 'build' / 'colcon_dub' / 'test_binaries').exists()
+    assert asyncio.run(task._build_tests(dub, ENV, [])) is None
+
+    task, runs = _create_test_task(
+        tmp_path, dub, monkeypatch,
+        dependencies={'pkg': str(tmp_path / 'install' / 'pkg')})
+    assert asyncio.run(task._test(dub, ENV)) is None
+    binary = tmp_path / 'build' / 'colcon_dub' / 'test_binaries' / \
+        object_path.name
+    assert runs == [('start', 'unittest', binary), ('end', 'unittest', binary)]
+
+
+def test_shards_run_built_executable(tmp_path: Path, monkeypatch):
+    """Check if the shards after the first run its test executable."""
+    pkg = tmp_path / 'pkg'
+    (pkg / 'source').mkdir(parents=True)
+    for name in ('a', 'b', 'c'):
+        (pkg / 'source' / (name + '.d')).write_text(
+            'module {name};'.format_map(locals()))
+    (pkg / 'dub.json').write_text(json.dumps({
+        'name': 'pkg',
+        'configurations': [{'name': 'unittest', 'targetType': 'library'}],
+    }))
+    (tmp_path / 'test.log').write_text('')
+    dub = DubPackage(pkg)
+    object_path = pkg / dub.test_object_path(dub.configurations[0])
+    object_path.write_text('stale')
+
+    task, runs = _create_test_task(
+        tmp_path, dub, monkeypatch, ['--dub-test-shards', '3'])
+    run_tests = task._run_tests
+
+    async def build_and_run_tests(config, shard, test_filter, env, semaphore,
+                                  binary, *, capture):
+        if binary is None:
+            # dub test builds the executable
+            assert not object_path.exists()
+            object_path.write_text('')
+        return await run_tests(
+            config, shard, test_filter, env, semaphore, binary,
+            capture=capture)
+
+    task._run_tests = build_and_run_tests
+    assert asyncio.run(task._test(dub, ENV)) is None
+    assert runs[:2] == [('start', 'unittest', None), ('end', 'unittest', None)]
+    assert runs[2:] == [
+        ('start', 'unittest', object_path), ('start', 'unittest', object_path),
+        ('end', 'unittest', object_path), ('end', 'unittest', object_path)]
@@ -0,0 +1,33 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+
+import csv
+import json
+from pathlib import Path
+
+from colcon_dub.dub.timing import PhaseTimer
+
+
+def test_phase_timer_report(tmp_path: Path):
+    """Check if the records are written as JSON and appended as CSV."""
+    timer = PhaseTimer('pkg', 'build')
+    with timer.phase('build', 'app') as record:
+        with timer.subprocess(record):
+            pass
+        record['cache_hit'] = False
+    with timer.phase('install') as record:
+        record['files_copied'] = 2
+        record['bytes_copied'] = 10
+
+    timer.write_json(tmp_path / 'timings.json')
+    records = json.loads((tmp_path / 'timings.json').read_text())
+    assert [r['phase'] for r in records] == ['build', 'install']
+    assert records[0]['configuration'] == 'app'
+    assert records[0]['subprocess_seconds'] <= records[0]['seconds']
+
+    timer.append_csv(tmp_path / 'report.csv')
+    timer.append_csv(tmp_path / 'report.csv')
+    with open(tmp_path / 'report.csv', newline='') as f:
+        rows = list(csv.DictReader(f))
+    assert len(rows) == 4
+    assert rows[1]['bytes_copied'] == '10'
@@ -0,0 +1,98 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+"""
+Measure the cost of identifying ament_dub packages during discovery.
+
+A workspace of plain directories, ROS packages of other build types and
+ament_dub packages is created. Every directory is identified once per
+repeat with empty package caches, like in a new colcon invocation, once
+without and once with a populated persistent identification cache.
+
+Usage: python benchmark/discovery.py [--packages N] [--repeat N]
+"""
+
+import argparse
+from pathlib import Path
+import tempfile
+import time
+
+from colcon_core.package_descriptor import PackageDescriptor
+from colcon_dub import dub
+from colcon_dub.dub import identification_cache
+from colcon_ros.package_identification import ros
+from colcon_ros_dub.package_identification.ament_dub import \
+    AmentDubPackageIdentification
+
+PACKAGE_XML = """<?xml version="1.0"?>
+<package format="3">
+  <name>{name}</name>
+  <version>0.0.1</version>
+  <description>Benchmark package</description>
+  <maintainer email="user@example.com">user</maintainer>
+  <license>Apache-2.0</license>
+  <export>
+    <build_type>{build_type}</build_type>
+  </export>
+</package>
+"""
+
+
+def _create_workspace(root: Path, count: int):
+    kinds = {'plain': [], 'ament_cmake': [], 'ament_dub': []}
+    for i in range(count):
+        for kind, paths in kinds.items():
+            name = '{kind}_{i}'.format_map(locals())
+            path = root / name
+            path.mkdir()
+            if kind != 'plain':
+                (path / 'package.xml').write_text(PACKAGE_XML.format(
+                    name=name, build_type=kind))
+            if kind == 'ament_dub':
+                (path / 'dub.json').write_text(
+                    '{{"name": "{name}"}}'.format_map(locals()))
+            paths.append(path)
+    return kinds
+
+
+def _identify(paths, repeat: int, cache_path=None) -> float:
+    extension = AmentDubPackageIdentification()
+    best = None
+    for _ in range(repeat):
+        dub._package_cache.clear()
+        ros._cached_packages.clear()
+        identification_cache._cache = \
+            identification_cache.IdentificationCache(cache_path) \
+            if cache_path else False
+        start = time.perf_counter()
+        for path in paths:
+            extension.identify(PackageDescriptor(path))
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+        if cache_path:
+            identification_cache._cache.save()
+    return best / len(paths)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--packages', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        kinds = _create_workspace(Path(tmp), args.packages)
+        kinds['all'] = [p for paths in list(kinds.values()) for p in paths]
+        cache_path = Path(tmp) / 'identification.json'
+        # Populate the persistent cache
+        _identify(kinds['all'], 1, cache_path)
+        print('{kind:12} {cold:>10} {warm:>10}  us / directory'.format(
+            kind='', cold='cold', warm='warm'))
+        for kind, paths in kinds.items():
+            cold = _identify(paths, args.repeat)
+            warm = _identify(paths, args.repeat, cache_path)
+            print('{kind:12} {cold:10.1f} {warm:10.1f}'.format(
+                kind=kind + ':', cold=cold * 1e6, warm=warm * 1e6))
+
+
+if __name__ == '__main__':
+    main()
@@ -1,15 +1,20 @@
 # Copyright 2021 nonanonno
 # Licensed under the Apache License, Version 2.0
 
-import copy
-
 from colcon_core.package_identification \
     import PackageIdentificationExtensionPoint
 from colcon_core.package_identification import PackageDescriptor
 from colcon_core.plugin_system import satisfies_version
+from colcon_dub.dub.identification_cache import get_identification_cache
+from colcon_dub.dub.identification_cache import get_stamps
 from colcon_dub.package_identification.dub import DubPackage
 from colcon_ros.package_identification.ros import RosPackageIdentification
 
+# The files an ament_dub package is identified by. The ignore markers of ROS
+# invalidate a cached identification.
+AMENT_DUB_FILES = (
+    'package.xml', 'dub.json', 'dub.sdl', 'CATKIN_IGNORE', 'AMENT_IGNORE')
+
 
 class AmentDubPackageIdentification(PackageIdentificationExtensionPoint):
     """Identify ROS DUB package with 'package.xml' and DUB package."""
@@ -23,6 +28,7 @@ class AmentDubPackageIdentification(PackageIdentificationExtensionPoint):
         satisfies_version(
             PackageIdentificationExtensionPoint.EXTENSION_POINT_VERSION,
             '^1.0')
+        self._ros_extension = RosPackageIdentification()
 
     def identify(self, desc: PackageDescriptor):
         """Check if the given path is ROS2 DUB package."""
@@ -30,23 +36,41 @@ class AmentDubPackageIdentification(PackageIdentificationExtensionPoint):
             # This package was already identified as another package type
             return
 
-        ros_desc = copy.deepcopy(desc)
-
-        ros_extension = RosPackageIdentification()
-        ros_extension.identify(ros_desc)
-
-        if ros_desc.type != 'ros.ament_dub':
+        # Most directories are neither ROS nor DUB packages, so check the
+        # files before parsing anything
+        if not (desc.path / 'package.xml').is_file():
             return
-
-        dub_package = DubPackage.load(ros_desc.path)
-        if not dub_package:
+        stamps = get_stamps(desc.path, AMENT_DUB_FILES)
+        if stamps[1] is None and stamps[2] is None:
             return
 
-        if ros_desc.name is not None and ros_desc.name != dub_package.name:
+        cache = get_identification_cache()
+        key = 'ros.ament_dub:{path}'.format(path=desc.path.absolute())
+        data = cache.get(key, stamps) if cache else None
+        if data is None:
+            data = self._identify(desc)
+            if data is None:
+                return
+            if cache:
+                cache.set(key, stamps, data)
+
+        name = desc.name or data['ros_name']
+        if name is not None and name != data['name']:
             raise RuntimeError('Package name already set to different value')
 
-        desc.type = ros_desc.type
-        desc.name = dub_package.name
-        desc.dependencies = ros_desc.dependencies
-        desc.hooks = ros_desc.hooks
-        desc.metadata = ros_desc.metadata
+        desc.type = 'ros.ament_dub'
+        desc.name = data['name']
+
+    def _identify(self, desc: PackageDescriptor):
+        # The ROS extension caches the parsed manifest by path, so the
+        # manifest is parsed once for both extensions. It only sets the type
+        # and the name, so a new descriptor does instead of a copy.
+        ros_desc = PackageDescriptor(desc.path)
+        self._ros_extension.identify(ros_desc)
+        if ros_desc.type != 'ros.ament_dub':
+            return None
+
+        dub_package = DubPackage.load(desc.path)
+        if not dub_package:
+            return None
+        return {'name': dub_package.name, 'ros_name': ros_desc.name}
@@ -34,7 +34,7 @@ def test_ament_dub_package_execute(bash: pytest_shell.shell.bash):
     """Check if the ament_dub package was built by executing ros_dub_test2."""
     bash.cd(WORKSPACE_ROOT)
     assert bash.run_script_inline([
-        './install/ros_dub_test2/lib/dub/ros_dub_test2/ros_dub_test2'
+        './install/ros_dub_test2/lib/ros_dub_test2/ros_dub_test2'
     ]) == 'ros_dub_test1'
 
 
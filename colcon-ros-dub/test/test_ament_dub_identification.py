@@ -0,0 +1,40 @@
+# Copyright 2021 nonanonno
+# Licensed under the Apache License, Version 2.0
+
+from pathlib import Path
+import shutil
+
+from colcon_core.package_descriptor import PackageDescriptor
+from colcon_dub.dub import identification_cache
+from colcon_ros_dub.package_identification.ament_dub import \
+    AmentDubPackageIdentification
+
+PATH_TO_PACKAGE = Path(__file__).absolute().parent / 'ros_dub_test1'
+
+
+def test_identify(tmp_path: Path, monkeypatch):
+    """Check if only ROS packages built by DUB are identified."""
+    # Don't read or write the identification cache of the user
+    monkeypatch.setattr(identification_cache, '_cache', False)
+    extension = AmentDubPackageIdentification()
+
+    desc = PackageDescriptor(PATH_TO_PACKAGE)
+    extension.identify(desc)
+    assert desc.type == 'ros.ament_dub'
+    assert desc.name == 'ros_dub_test1'
+
+    # A ROS package of another build type
+    shutil.copy(PATH_TO_PACKAGE / 'package.xml', tmp_path / 'package.xml')
+    (tmp_path / 'package.xml').write_text(
+        (tmp_path / 'package.xml').read_text().replace(
+            'ament_dub', 'ament_cmake'))
+    (tmp_path / 'dub.json').write_text('{"name": "ros_dub_test1"}')
+    desc = PackageDescriptor(tmp_path)
+    extension.identify(desc)
+    assert desc.type is None
+
+    # A DUB package without package.xml
+    (tmp_path / 'package.xml').unlink()
+    desc = PackageDescriptor(tmp_path)
+    extension.identify(desc)
+    assert desc.type is None